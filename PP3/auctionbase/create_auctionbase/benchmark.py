@@ -0,0 +1,583 @@
+"""
+FILE: benchmark.py
+------------------
+Benchmarks for the eBay json parser. Every benchmark takes the json files to
+run over on the command line and defaults to the same ../ebay_data/items-*.json
+corpus that runParser.sh parses.
+
+memory -- runs skeleton_parser.py over the corpus once decoding whole files
+and once with --stream, each in a process of its own, and reports the peak
+resident set size of every run. The corpus is also merged into one synthetic
+file holding --copies copies of every item, which shows how the peak of each
+mode follows the size of the largest input file.
+
+    python benchmark.py memory [--copies N] [<path to json files>]
+
+transforms -- times transformDollar and transformDttm against the original
+regex and split based versions on every amount and timestamp of the corpus,
+checks both give the same output, and fails unless the combined speedup is at
+least --min-speedup.
+
+    python benchmark.py transforms [--repeat N] [--min-speedup X] [<path to json files>]
+
+throughput -- runs the parser pipeline stage by stage over the corpus and over
+synthetic copies of it scaled up --scales times, with the ItemIDs and UserIDs
+of every copy made unique so nothing is deduplicated away. The stages are
+decode (json to items), transform (items to rows), dedup, write (.dat files)
+and load (SQLite through bulk_loader). Every stage runs in a process of its
+own over the pipeline up to it, and its time is what it adds to the stage it
+builds on; peak RSS is that of the whole process. Items/s, bids/s, MB/s of
+json and peak RSS of every stage are printed and saved as JSON to --output,
+along with the commit and versions they were measured on, so runs can be
+compared across releases; --baseline prints the change in items/s from an
+earlier results file. The synthetic copies are written under --scratch; 100
+copies take about 3 GB.
+
+    python benchmark.py throughput [--scales 1,10,100] [--repeat N] [--output FILE]
+                                   [--baseline FILE] [--scratch DIR] [<path to json files>]
+
+bids -- loads the corpus into a database and times inserting bids into it,
+once under the original trigger1 to trigger8 and once under the triggers
+createDatabase.sh installs: trigger1, the consolidated bid_triggers_add.sql
+and fts_add.sql, on top of the indexes and auction statuses both runs share.
+Every round moves the time on by a second
+and places one bid on every open auction, the bids of a round in a single
+transaction. Both runs must leave Items identical, and a set of bids breaking
+every constraint must fail with the same errors under both.
+
+    python benchmark.py bids [--rounds N] [--repeat N] [<path to json files>]
+"""
+
+import os
+import sys
+import re
+import json
+import glob
+import time
+import shutil
+import sqlite3
+import platform
+import argparse
+import tempfile
+import subprocess
+
+import skeleton_parser
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PARSER = os.path.join(HERE, 'skeleton_parser.py')
+DEFAULT_CORPUS = '../ebay_data/items-*.json'
+
+# Stages of the parser pipeline, each with the stage it builds on
+STAGES = [
+    ('decode', None),
+    ('transform', 'decode'),
+    ('dedup', 'transform'),
+    ('write', 'dedup'),
+    ('load', 'dedup'),
+]
+PARENTS = dict(STAGES)
+
+# Trigger scripts of the bids benchmark, original and consolidated, the
+# consolidated ones being those createDatabase.sh runs after status_add.sql
+TRIGGER_SETS = [
+    ('trigger1-8', ['trigger%d_add.sql' % n for n in range(1, 9)] + ['fts_add.sql']),
+    ('consolidated', ['trigger1_add.sql', 'bid_triggers_add.sql', 'fts_add.sql']),
+]
+
+# Time the bids benchmark starts at, when many auctions are open
+BIDS_START = '2001-12-12 00:00:00'
+
+# Added to the ItemIDs of every further synthetic copy of the corpus, well
+# above the largest ItemID of the corpus
+ID_STRIDE = 10 ** 10
+
+"""
+Returns the json files to benchmark, falling back to the default corpus
+"""
+def corpusFiles(files):
+    files = [os.path.abspath(f) for f in files or sorted(glob.glob(DEFAULT_CORPUS))]
+    if not files:
+        print >> sys.stderr, 'No json files found, pass the corpus on the command line'
+        sys.exit(1)
+    return files
+
+"""
+Returns the total size of a list of files in megabytes
+"""
+def sizeMB(files):
+    return sum(os.path.getsize(f) for f in files) / float(1 << 20)
+
+"""
+Writes every item of files, copies times over, into a single json file at path.
+Items are streamed through one at a time so the merge itself stays small. The
+items schema of the corpus is copied next to it for the parser to find.
+"""
+def mergeCorpus(files, path, copies):
+    schema = os.path.join(os.path.dirname(files[0]), skeleton_parser.SCHEMA_FILE)
+    if os.path.isfile(schema):
+        shutil.copy(schema, os.path.dirname(path))
+    with open(path, 'w') as out:
+        out.write('{"Items": [')
+        first = True
+        for _ in range(copies):
+            for name in files:
+                with open(name, 'r') as f:
+                    for item in skeleton_parser.streamItems(f):
+                        if not first:
+                            out.write(', ')
+                        out.write(json.dumps(item))
+                        first = False
+        out.write(']}')
+
+"""
+Runs a command in an empty scratch directory and returns what it printed and
+its peak resident set size in megabytes
+"""
+def runMeasured(command):
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    try:
+        p = subprocess.Popen(command, cwd=workdir, stdout=subprocess.PIPE)
+        output = p.stdout.read()
+        _, status, usage = os.wait4(p.pid, 0)
+        if os.WEXITSTATUS(status) != 0:
+            raise RuntimeError('failed: ' + ' '.join(command[:4]) + ' ...')
+        # ru_maxrss is reported in kilobytes on Linux
+        return output, usage.ru_maxrss / 1024.0
+    finally:
+        shutil.rmtree(workdir)
+
+"""
+Runs the parser over files and returns the peak resident set size of the
+parser process in megabytes
+"""
+def peakRSS(files, options):
+    return runMeasured([sys.executable, PARSER] + options + files)[1]
+
+"""
+The transforms as skeleton_parser.py first shipped them, as a baseline
+"""
+def legacyTransformDttm(dttm):
+    dttm = dttm.strip().split(' ')
+    dt = dttm[0].split('-')
+    date = '20' + dt[2] + '-'
+    date += skeleton_parser.transformMonth(dt[0]) + '-' + dt[1]
+    return date + ' ' + dttm[1]
+
+def legacyTransformDollar(money):
+    if money == None or len(money) == 0:
+        return money
+    return re.sub(r'[^\d.]', '', money)
+
+"""
+Returns every dollar amount and every timestamp found in files
+"""
+def corpusFields(files):
+    amounts, stamps = [], []
+    for name in files:
+        with open(name, 'r') as f:
+            for item in skeleton_parser.streamItems(f):
+                amounts.extend([item['Currently'], item['First_Bid'], item.get('Buy_Price')])
+                stamps.extend([item['Started'], item['Ends']])
+                for bidsIterator in item['Bids'] or []:
+                    bid = bidsIterator['Bid']
+                    amounts.append(bid['Amount'])
+                    stamps.append(bid['Time'])
+    return amounts, stamps
+
+"""
+Returns the best of repeat timings of transform over values. The memos of
+skeleton_parser are emptied before every run so each one starts cold.
+"""
+def timeTransform(transform, values, repeat):
+    best = None
+    for _ in range(repeat):
+        skeleton_parser.dollarMemo.clear()
+        skeleton_parser.dateMemo.clear()
+        start = time.time()
+        map(transform, values)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def benchTransforms(args):
+    amounts, stamps = corpusFields(corpusFiles(args.files))
+    cases = [('transformDollar', legacyTransformDollar, skeleton_parser.transformDollar, amounts),
+             ('transformDttm', legacyTransformDttm, skeleton_parser.transformDttm, stamps)]
+    print '%-16s %9s %12s %12s %8s' % ('transform', 'values', 'legacy ms', 'current ms', 'speedup')
+    legacyTotal = currentTotal = 0.0
+    for name, legacy, current, values in cases:
+        if map(legacy, values) != map(current, values):
+            raise RuntimeError(name + ' output differs from the legacy version')
+        legacyTime = timeTransform(legacy, values, args.repeat)
+        currentTime = timeTransform(current, values, args.repeat)
+        legacyTotal += legacyTime
+        currentTotal += currentTime
+        print '%-16s %9d %12.1f %12.1f %7.1fx' % (name, len(values),
+                legacyTime * 1000, currentTime * 1000, legacyTime / currentTime)
+    speedup = legacyTotal / currentTotal
+    print '%-16s %9s %12.1f %12.1f %7.1fx' % ('total', '',
+            legacyTotal * 1000, currentTotal * 1000, speedup)
+    if speedup < args.minSpeedup:
+        print >> sys.stderr, 'Speedup %.1fx is below the required %.1fx' % (speedup, args.minSpeedup)
+        sys.exit(1)
+
+def benchMemory(args):
+    files = corpusFiles(args.files)
+    scratch = tempfile.mkdtemp(prefix='bench-')
+    try:
+        merged = os.path.join(scratch, 'items-merged.json')
+        mergeCorpus(files, merged, args.copies)
+        inputs = [('corpus (%d files)' % len(files), files),
+                  ('merged x%d (1 file)' % args.copies, [merged])]
+        print '%-22s %10s %14s %14s' % ('input', 'size MB', 'load RSS MB', 'stream RSS MB')
+        for label, paths in inputs:
+            print '%-22s %10.1f %14.1f %14.1f' % (label, sizeMB(paths),
+                    peakRSS(paths, []), peakRSS(paths, ['--stream']))
+    finally:
+        shutil.rmtree(scratch)
+
+"""
+Writes copies synthetic copies of the corpus files into outdir and returns
+their paths. The first copy is the corpus itself; every further one has its
+ItemIDs moved up by ID_STRIDE and its UserIDs suffixed with the copy number,
+so each copy adds as many unique rows as the corpus has.
+"""
+def scaleCorpus(files, outdir, copies):
+    os.makedirs(outdir)
+    schema = os.path.join(os.path.dirname(files[0]), skeleton_parser.SCHEMA_FILE)
+    if os.path.isfile(schema):
+        shutil.copy(schema, outdir)
+    paths = []
+    for n, name in enumerate(files):
+        path = os.path.join(outdir, 'items-%d-0.json' % n)
+        shutil.copy(name, path)
+        paths.append(path)
+    for copy in range(1, copies):
+        for n, name in enumerate(files):
+            with open(name, 'r') as f:
+                items = skeleton_parser.loadItems(f)
+            for item in items:
+                renumberItem(item, copy)
+            path = os.path.join(outdir, 'items-%d-%d.json' % (n, copy))
+            with open(path, 'w') as f:
+                json.dump({'Items': items}, f)
+            paths.append(path)
+    return paths
+
+"""
+Makes the ids of an item those of its copy-th synthetic copy
+"""
+def renumberItem(item, copy):
+    suffix = '-%d' % copy
+    item['ItemID'] = str(int(item['ItemID']) + copy * ID_STRIDE)
+    item['Seller']['UserID'] += suffix
+    for bidsIterator in item['Bids'] or []:
+        bidsIterator['Bid']['Bidder']['UserID'] += suffix
+
+"""
+Returns the number of items and bids in files
+"""
+def corpusCounts(files):
+    items = bids = 0
+    for name in files:
+        with open(name, 'r') as f:
+            for item in skeleton_parser.streamItems(f):
+                items += 1
+                bids += len(item['Bids'] or [])
+    return items, bids
+
+"""
+Yields what the pipeline up to stage makes of files: items after decode, and
+(relation, row) pairs after any later stage
+"""
+def stageRows(stage, files):
+    transform = stage != 'decode'
+    for name in files:
+        decoder = skeleton_parser.itemDecoder(name)
+        with open(name, 'r') as f:
+            for item in skeleton_parser.streamItems(f):
+                if transform:
+                    for pair in decoder.itemRows(item):
+                        yield pair
+                else:
+                    yield item
+
+"""
+Runs the pipeline up to stage over files in the current directory and prints
+the time it took as JSON. Runs in a process of its own for benchThroughput.
+"""
+def benchStage(args):
+    import bulk_loader
+    sink = None
+    if args.stage == 'write':
+        sink = skeleton_parser.DatSink('.')
+    elif args.stage == 'load':
+        sink = bulk_loader.openSqliteSink('AuctionBase')
+    start = time.time()
+    rows = stageRows(args.stage, args.files)
+    if args.stage not in ('decode', 'transform'):
+        rows = skeleton_parser.uniqueRows(rows, skeleton_parser.newSeenKeys())
+    if sink is None:
+        for _ in rows:
+            pass
+    else:
+        for relation, row in rows:
+            sink.write(relation, row)
+        sink.close()
+    print json.dumps({'seconds': time.time() - start})
+
+"""
+Returns the best time and the peak RSS of repeat runs of the pipeline up to
+stage over files
+"""
+def measureStage(stage, files, repeat):
+    best = peak = None
+    for _ in range(repeat):
+        output, rss = runMeasured([sys.executable, os.path.join(HERE, 'benchmark.py'),
+                'stage', stage] + files)
+        seconds = json.loads(output)['seconds']
+        best = seconds if best is None else min(best, seconds)
+        peak = rss if peak is None else max(peak, rss)
+    return best, peak
+
+"""
+Returns the commit the benchmarked code is at, or None outside a git checkout
+"""
+def gitCommit():
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=HERE,
+                    stderr=devnull).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+"""
+Returns a rate, or None when the time is too short to give one
+"""
+def perSecond(amount, seconds):
+    return amount / seconds if seconds > 0 else None
+
+def benchThroughput(args):
+    files = corpusFiles(args.files)
+    scales = [int(scale) for scale in args.scales.split(',')]
+    items, bids = corpusCounts(files)
+    results = {
+        'commit': gitCommit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'repeat': args.repeat,
+        'scales': [],
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = dict(((run['scale'], stage['stage']), stage['itemsPerSecond'])
+                    for run in json.load(f)['scales'] for stage in run['stages'])
+    scratch = tempfile.mkdtemp(prefix='bench-', dir=args.scratch)
+    try:
+        for scale in scales:
+            paths = files
+            if scale > 1:
+                paths = scaleCorpus(files, os.path.join(scratch, 'x%d' % scale), scale)
+            mb = sizeMB(paths)
+            run = {'scale': scale, 'files': len(paths), 'items': items * scale,
+                   'bids': bids * scale, 'megabytes': mb, 'stages': []}
+            print '\n%dx: %d files, %.1f MB, %d items, %d bids' % (scale, len(paths), mb,
+                    run['items'], run['bids'])
+            print '%-10s %9s %11s %11s %9s %9s%s' % ('stage', 'seconds', 'items/s', 'bids/s',
+                    'MB/s', 'RSS MB', '  vs baseline' if baseline else '')
+            cumulative = {None: 0.0}
+            for stage, parent in STAGES:
+                total, rss = measureStage(stage, paths, args.repeat)
+                cumulative[stage] = total
+                seconds = total - cumulative[parent]
+                result = {'stage': stage, 'seconds': seconds, 'cumulativeSeconds': total,
+                          'itemsPerSecond': perSecond(run['items'], seconds),
+                          'bidsPerSecond': perSecond(run['bids'], seconds),
+                          'megabytesPerSecond': perSecond(mb, seconds),
+                          'peakRSSMegabytes': rss}
+                run['stages'].append(result)
+                change = ''
+                before = baseline and baseline.get((scale, stage))
+                if before and result['itemsPerSecond']:
+                    change = '  %+.1f%%' % ((result['itemsPerSecond'] / before - 1) * 100)
+                print '%-10s %9.3f %11.0f %11.0f %9.1f %9.1f%s' % (stage, seconds,
+                        result['itemsPerSecond'] or 0, result['bidsPerSecond'] or 0,
+                        result['megabytesPerSecond'] or 0, rss, change)
+            results['scales'].append(run)
+            if scale > 1:
+                shutil.rmtree(os.path.join(scratch, 'x%d' % scale))
+    finally:
+        shutil.rmtree(scratch)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print '\nResults saved to ' + args.output
+
+"""
+Loads files into a new database at path the way bulk_loader.py --create does,
+with its indexes and auction statuses but none of its triggers, which are left
+to each run to add
+"""
+def loadDatabase(files, path):
+    import bulk_loader
+    conn = bulk_loader.connect(path, fast=True)
+    bulk_loader.runScript(conn, bulk_loader.CREATE_SQL)
+    conn.execute('BEGIN IMMEDIATE')
+    bulk_loader.loadJson(conn, files, quarantine=skeleton_parser.Quarantine(os.devnull))
+    conn.execute('COMMIT')
+    for script in [bulk_loader.INDEXES_SQL, bulk_loader.STATUS_SQL]:
+        bulk_loader.runScript(conn, script)
+    conn.close()
+
+"""
+Places rounds rounds of bids on the database at path, each a second after the
+time before and with a bid on every open auction, returning the number of bids
+and the seconds spent inserting them
+"""
+def placeBids(path, rounds):
+    conn = sqlite3.connect(path, isolation_level=None)
+    users = [user for user, in conn.execute('SELECT UserID FROM Users ORDER BY UserID LIMIT 2')]
+    count, seconds = 0, 0.0
+    for n in range(rounds):
+        conn.execute("UPDATE CurrentTime SET Time = datetime(Time, '+1 second')")
+        now, = conn.execute('SELECT Time FROM CurrentTime').fetchone()
+        bids = [(item, users[0] if seller != users[0] else users[1], currently + 1, now)
+                for item, currently, seller in conn.execute(
+                    "SELECT ItemID, Currently, Seller_UserID FROM Items WHERE Status = 'open'")]
+        start = time.time()
+        conn.execute('BEGIN')
+        conn.executemany('INSERT INTO Bids (ItemID, UserID, Amount, Time) VALUES (?, ?, ?, ?)', bids)
+        conn.execute('COMMIT')
+        seconds += time.time() - start
+        count += len(bids)
+    conn.close()
+    return count, seconds
+
+"""
+Returns the error every bid of a set breaking each constraint checked on Bids
+fails with on the database at path, or None for a bid that goes in
+"""
+def bidErrors(path):
+    conn = sqlite3.connect(path, isolation_level=None)
+    now, = conn.execute('SELECT Time FROM CurrentTime').fetchone()
+    item, currently, seller, started, ends = conn.execute("SELECT ItemID, Currently, Seller_UserID, "
+            "Started, Ends FROM Items WHERE Status = 'open' ORDER BY ItemID LIMIT 1").fetchone()
+    user, = conn.execute('SELECT UserID FROM Users WHERE UserID != ? ORDER BY UserID LIMIT 1',
+            (seller,)).fetchone()
+    bids = [
+        (item, seller, currently + 1, now),
+        (item, user, currently + 1, ends + 'x'),
+        (item, user, currently + 1, '2000-01-01 00:00:00'),
+        (item, user, currently, now),
+        (item, user, currently + 1, started),
+        (item, seller, currently, '2000-01-01 00:00:00'),
+        (item, user, currently - 1, ends + 'x'),
+        (item, user, currently + 1, now),
+    ]
+    errors = []
+    for bid in bids:
+        conn.execute('BEGIN')
+        try:
+            conn.execute('INSERT INTO Bids (ItemID, UserID, Amount, Time) VALUES (?, ?, ?, ?)', bid)
+            errors.append(None)
+            conn.execute('ROLLBACK')
+        except sqlite3.DatabaseError as e:
+            # the triggers roll the transaction back themselves
+            errors.append(str(e))
+    conn.close()
+    return errors
+
+def benchBids(args):
+    files = corpusFiles(args.files)
+    scratch = tempfile.mkdtemp(prefix='bench-')
+    try:
+        loaded = os.path.join(scratch, 'loaded')
+        loadDatabase(files, loaded)
+        conn = sqlite3.connect(loaded)
+        conn.execute('UPDATE CurrentTime SET Time = ?', (BIDS_START,))
+        conn.commit()
+        conn.close()
+        states, errors = {}, {}
+        print '%-14s %8s %9s %11s' % ('triggers', 'bids', 'seconds', 'bids/s')
+        for name, scripts in TRIGGER_SETS:
+            best = None
+            for _ in range(args.repeat):
+                path = os.path.join(scratch, name)
+                shutil.copy(loaded, path)
+                conn = sqlite3.connect(path, isolation_level=None)
+                for script in scripts:
+                    with open(os.path.join(HERE, script), 'r') as f:
+                        conn.executescript(f.read())
+                conn.close()
+                count, seconds = placeBids(path, args.rounds)
+                best = seconds if best is None else min(best, seconds)
+            conn = sqlite3.connect(path)
+            states[name] = conn.execute('SELECT ItemID, Currently, Number_of_Bids, Status '
+                    'FROM Items ORDER BY ItemID').fetchall()
+            conn.close()
+            errors[name] = bidErrors(path)
+            print '%-14s %8d %9.3f %11.0f' % (name, count, best, perSecond(count, best) or 0)
+        (first, _), (second, _) = TRIGGER_SETS
+        if states[first] != states[second]:
+            print >> sys.stderr, 'Items differ between %s and %s' % (first, second)
+            sys.exit(1)
+        if errors[first] != errors[second]:
+            print >> sys.stderr, 'Errors differ between %s and %s: %r != %r' % (
+                    first, second, errors[first], errors[second])
+            sys.exit(1)
+        print 'Items and errors identical under both'
+    finally:
+        shutil.rmtree(scratch)
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog=argv[0])
+    commands = parser.add_subparsers()
+
+    memory = commands.add_parser('memory', help='peak RSS of whole-file vs streaming decoding')
+    memory.add_argument('--copies', type=int, default=4,
+            help='copies of the corpus in the merged file (default 4)')
+    memory.add_argument('files', nargs='*')
+    memory.set_defaults(run=benchMemory)
+
+    transforms = commands.add_parser('transforms', help='speed of the dollar and date transforms')
+    transforms.add_argument('--repeat', type=int, default=5,
+            help='timed runs per transform, the best one is kept (default 5)')
+    transforms.add_argument('--min-speedup', dest='minSpeedup', type=float, default=3.0,
+            help='combined speedup below which the benchmark fails (default 3)')
+    transforms.add_argument('files', nargs='*')
+    transforms.set_defaults(run=benchTransforms)
+
+    throughput = commands.add_parser('throughput', help='items/s, MB/s and peak RSS per pipeline stage')
+    throughput.add_argument('--scales', default='1,10,100',
+            help='comma separated copies of the corpus to run over (default 1,10,100)')
+    throughput.add_argument('--repeat', type=int, default=1,
+            help='timed runs per stage, the best one is kept (default 1)')
+    throughput.add_argument('--output', default='throughput.json',
+            help='file the results are saved to as JSON (default throughput.json)')
+    throughput.add_argument('--baseline', metavar='FILE',
+            help='earlier results to compare items/s against')
+    throughput.add_argument('--scratch', metavar='DIR',
+            help='directory to write the synthetic copies under (default: the system temp dir)')
+    throughput.add_argument('files', nargs='*')
+    throughput.set_defaults(run=benchThroughput)
+
+    bids = commands.add_parser('bids', help='bid inserts/s under the original and consolidated triggers')
+    bids.add_argument('--rounds', type=int, default=5,
+            help='rounds of one bid on every open auction (default 5)')
+    bids.add_argument('--repeat', type=int, default=3,
+            help='timed runs per trigger set, the best one is kept (default 3)')
+    bids.add_argument('files', nargs='*')
+    bids.set_defaults(run=benchBids)
+
+    stage = commands.add_parser('stage', help='run the pipeline up to one stage (used by throughput)')
+    stage.add_argument('stage', choices=[name for name, _ in STAGES])
+    stage.add_argument('files', nargs='+')
+    stage.set_defaults(run=benchStage)
+
+    args = parser.parse_args(argv[1:])
+    args.run(args)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,45 @@
+-- description: Constraints 8, 9, 11, 13, 14 and 15 in two triggers on Bids,
+-- replacing trigger2 to trigger8 (trigger1, on CurrentTime, stays as it is)
+
+PRAGMA foreign_keys = ON;
+
+drop trigger if exists trigger2;
+drop trigger if exists trigger3;
+drop trigger if exists trigger4;
+drop trigger if exists trigger5;
+drop trigger if exists trigger6;
+drop trigger if exists trigger7;
+drop trigger if exists trigger8;
+drop trigger if exists BidsCheck;
+drop trigger if exists BidsApply;
+
+-- Every check reads the same row of Items and CurrentTime, looked up once.
+-- They come in the order the separate triggers fired in, the last created
+-- first, so a bid breaking several constraints fails with the same error as
+-- before. A bid on a missing item joins no row and is left to the foreign key.
+create trigger BidsCheck
+	before insert on Bids
+	for each row
+	begin
+		SELECT case
+			when NEW.UserID = i.Seller_UserID then raise(rollback, ‘Trigger7_Failed’)
+			when NEW.Time > i.Ends then raise(rollback, ‘Trigger6_Failed’)
+			when NEW.Time < i.Started then raise(rollback, ‘Trigger5_Failed’)
+			when NEW.Amount <= i.Currently then raise(rollback, ‘Trigger3_Failed’)
+			when NEW.Time != c.Time then raise(rollback, ‘Trigger2_Failed’)
+		end
+		from Items i, CurrentTime c
+		where i.ItemID = NEW.ItemID;
+	end;
+
+-- the bid count and current price of the item, in one update. The status of
+-- status_add.sql is left out: writing it would rewrite its index entry on
+-- every bid, and ItemsStatusUpdate already sets it on the rare bid that
+-- changes it.
+create trigger BidsApply
+	after insert on Bids
+	for each row
+	begin
+		UPDATE Items SET Number_of_Bids = Number_of_Bids + 1, Currently = NEW.Amount
+			WHERE NEW.ItemID = Items.ItemID;
+	end;
@@ -0,0 +1,4 @@
+PRAGMA foreign_keys = ON;
+
+drop trigger BidsCheck;
+drop trigger BidsApply;
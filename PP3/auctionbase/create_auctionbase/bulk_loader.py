@@ -0,0 +1,274 @@
+"""
+FILE: bulk_loader.py
+------------------
+Loads eBay json files straight into the AuctionBase SQLite database, without
+the .dat files, the sqlite3 shell or the UPDATE passes of load.txt. Items go
+through the same decoding and deduplication as skeleton_parser.py and are
+inserted with executemany in batches, all inside a single transaction, with
+missing values stored as real NULLs.
+
+    python bulk_loader.py [--db AuctionBase] [--create | --incremental] [--fast] [--cache DIR]
+                          [--schema FILE] [--quarantine FILE] <path to json files>
+
+--create runs create.sql first, dropping and recreating every table, and once
+the rows are in the rest of createDatabase.sh, in its order: indexes_add.sql,
+status_add.sql, trigger1_add.sql, bid_triggers_add.sql and fts_add.sql.
+--fast turns the rollback journal and fsync off for the duration of the load.
+That is only safe on a database that can be rebuilt from the json files if the
+load is interrupted.
+
+--incremental loads into an existing AuctionBase. The LoadedFiles table keeps
+the SHA-1 digest of every json file loaded so far, and files whose digest is
+unchanged are skipped. Rows of new or changed files are upserted: items and
+users are inserted or, when they differ from the stored row, updated in place;
+categories and bids already present are left alone. The triggers on Bids,
+which only hold for bids placed live, are dropped for the load and recreated
+before it commits. Upserts need SQLite 3.24 or later.
+
+--cache reads the rows of files already parsed once from the columnar cache in
+DIR instead of decoding their json again (see columnar_cache.py).
+"""
+
+import os
+import sys
+import sqlite3
+import argparse
+
+import skeleton_parser
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CREATE_SQL = os.path.join(HERE, 'create.sql')
+INDEXES_SQL = os.path.join(HERE, 'indexes_add.sql')
+STATUS_SQL = os.path.join(HERE, 'status_add.sql')
+TRIGGER1_SQL = os.path.join(HERE, 'trigger1_add.sql')
+BID_TRIGGERS_SQL = os.path.join(HERE, 'bid_triggers_add.sql')
+FTS_SQL = os.path.join(HERE, 'fts_add.sql')
+
+# Scripts run once a freshly created database is loaded, in the order
+# createDatabase.sh runs them
+AFTER_CREATE = [INDEXES_SQL, STATUS_SQL, TRIGGER1_SQL, BID_TRIGGERS_SQL, FTS_SQL]
+
+# Table and columns of each relation, in the order of skeleton_parser.ItemDecoder.itemRows
+TABLES = {
+    'items': 'Items',
+    'categories': 'Categories',
+    'bids': 'Bids',
+    'users': 'Users',
+}
+COLUMNS = {
+    'items': ['ItemID', 'Name', 'Currently', 'First_Bid', 'Buy_Price', 'Number_of_Bids',
+              'Started', 'Ends', 'Seller_UserID', 'Description'],
+    'categories': ['ItemID', 'Category'],
+    'bids': ['ItemID', 'UserID', 'Amount', 'Time'],
+    'users': ['UserID', 'Rating', 'Location', 'Country'],
+}
+
+# Primary key of the relations that are updated in place by an incremental load
+UPSERT_KEYS = {'items': 'ItemID', 'users': 'UserID'}
+
+# Rows buffered per relation before they are handed to executemany
+BATCH_SIZE = 10000
+
+CREATE_LOADED_FILES = '''CREATE TABLE IF NOT EXISTS LoadedFiles (
+   Path TEXT,
+   Digest TEXT,
+   PRIMARY KEY(Path)
+)'''
+
+"""
+Returns the insert statement of a relation
+"""
+def insertStatement(relation):
+    columns = COLUMNS[relation]
+    return 'INSERT INTO %s (%s) VALUES (%s)' % (TABLES[relation],
+            ', '.join(columns), ', '.join(['?'] * len(columns)))
+
+"""
+Returns the statement an incremental load writes the rows of a relation with.
+Items and users are updated when any column differs from the stored row, other
+relations are keyed on every column that matters and only ever inserted.
+"""
+def upsertStatement(relation):
+    if relation not in UPSERT_KEYS:
+        return insertStatement(relation).replace('INSERT INTO', 'INSERT OR IGNORE INTO', 1)
+    table, key = TABLES[relation], UPSERT_KEYS[relation]
+    columns = [column for column in COLUMNS[relation] if column != key]
+    return '%s ON CONFLICT(%s) DO UPDATE SET %s WHERE (%s) IS NOT (%s)' % (
+            insertStatement(relation), key,
+            ', '.join('%s = excluded.%s' % (column, column) for column in columns),
+            ', '.join('%s.%s' % (table, column) for column in columns),
+            ', '.join('excluded.%s' % column for column in columns))
+
+INSERTS = dict((relation, insertStatement(relation)) for relation in TABLES)
+UPSERTS = dict((relation, upsertStatement(relation)) for relation in TABLES)
+
+"""
+Opens the database with transactions under our control rather than the
+sqlite3 module's, optionally without journal or fsync
+"""
+def connect(db, fast=False):
+    conn = sqlite3.connect(db, isolation_level=None)
+    if fast:
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+    return conn
+
+"""
+Runs the SQL script at path on conn
+"""
+def runScript(conn, path):
+    with open(path, 'r') as f:
+        conn.executescript(f.read())
+
+"""
+Records files, given as (path, digest) pairs, as loaded
+"""
+def recordFiles(conn, files):
+    conn.execute(CREATE_LOADED_FILES)
+    conn.executemany('INSERT OR REPLACE INTO LoadedFiles (Path, Digest) VALUES (?, ?)', files)
+
+"""
+Output sink inserting rows into the database on conn in batches of batchSize
+rows per relation, with the statement of each relation given in statements.
+counts keeps the number of rows written per relation. When commit is set,
+closing the sink commits the open transaction, runs the SQL scripts given in
+scripts and closes the connection.
+"""
+class SqliteSink(object):
+    def __init__(self, conn, statements=INSERTS, batchSize=BATCH_SIZE, commit=False, scripts=()):
+        self.conn = conn
+        self.statements = statements
+        self.batchSize = batchSize
+        self.commit = commit
+        self.scripts = scripts
+        self.batches = dict((relation, []) for relation in skeleton_parser.RELATIONS)
+        self.counts = dict((relation, 0) for relation in skeleton_parser.RELATIONS)
+
+    def write(self, relation, row):
+        batch = self.batches[relation]
+        batch.append(row)
+        if len(batch) >= self.batchSize:
+            self.flush(relation)
+
+    def flush(self, relation):
+        batch = self.batches[relation]
+        if batch:
+            self.counts[relation] += self.conn.executemany(self.statements[relation], batch).rowcount
+            del batch[:]
+
+    def close(self):
+        for relation in skeleton_parser.RELATIONS:
+            self.flush(relation)
+        if self.commit:
+            self.conn.execute('COMMIT')
+            for path in self.scripts:
+                runScript(self.conn, path)
+            self.conn.close()
+
+"""
+Returns the sink of skeleton_parser.py --format sqlite: a SqliteSink loading
+into a freshly created database db inside a single transaction, and running
+the scripts of AFTER_CREATE once the rows are in
+"""
+def openSqliteSink(db):
+    conn = connect(db)
+    runScript(conn, CREATE_SQL)
+    conn.execute('BEGIN IMMEDIATE')
+    return SqliteSink(conn, commit=True, scripts=AFTER_CREATE)
+
+"""
+Inserts the unique rows of every json file into the database in batches of
+batchSize rows per relation, with the statement of each relation given in
+statements. Rows are taken from the columnar cache in cacheDir when one is
+given, and malformed items go to quarantine. Returns the number of rows
+written per relation.
+"""
+def loadJson(conn, files, stream=True, seen=None, batchSize=BATCH_SIZE, statements=INSERTS,
+        cacheDir=None, quarantine=None):
+    sink = SqliteSink(conn, statements, batchSize)
+    if seen is None:
+        seen = skeleton_parser.newSeenKeys()
+    for json_file in files:
+        skeleton_parser.parseJson(json_file, stream, seen=seen, cacheDir=cacheDir, sink=sink,
+                quarantine=quarantine)
+    sink.close()
+    return sink.counts
+
+"""
+Upserts the rows of the files that are new or changed since they were last
+loaded, with the Bids triggers out of the way. Must run inside a transaction.
+Returns the number of rows written per relation and the files skipped.
+"""
+def loadIncremental(conn, files, stream=True, cacheDir=None, quarantine=None):
+    conn.execute(CREATE_LOADED_FILES)
+    loaded = dict(conn.execute('SELECT Path, Digest FROM LoadedFiles'))
+    digests = [(os.path.abspath(f), skeleton_parser.fileDigest(f)) for f in files]
+    delta = [(path, digest) for path, digest in digests if loaded.get(path) != digest]
+    skipped = [path for path, digest in digests if loaded.get(path) == digest]
+    triggers = conn.execute("SELECT name, sql FROM sqlite_master "
+            "WHERE type = 'trigger' AND tbl_name = 'Bids'").fetchall()
+    for name, _ in triggers:
+        conn.execute('DROP TRIGGER %s' % name)
+    counts = loadJson(conn, [path for path, _ in delta], stream, statements=UPSERTS,
+            cacheDir=cacheDir, quarantine=quarantine)
+    for _, sql in triggers:
+        conn.execute(sql)
+    recordFiles(conn, delta)
+    return counts, skipped
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog=argv[0])
+    parser.add_argument('--db', default='AuctionBase',
+            help='SQLite database file to load into (default AuctionBase)')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--create', action='store_true',
+            help='(re)create the schema with create.sql before loading')
+    mode.add_argument('--incremental', action='store_true',
+            help='upsert only files not loaded yet or changed since')
+    parser.add_argument('--fast', action='store_true',
+            help='disable journaling and sync during the load')
+    parser.add_argument('--cache', metavar='DIR',
+            help='read parsed rows from, and save them to, a columnar cache in DIR')
+    parser.add_argument('--schema', metavar='FILE',
+            help='items schema to decode with (default: the %s next to each json '
+                 'file, or else the one in ebay_data)' % skeleton_parser.SCHEMA_FILE)
+    parser.add_argument('--quarantine', metavar='FILE', default=skeleton_parser.QUARANTINE_FILE,
+            help='file malformed items are appended to (default %s)'
+                 % skeleton_parser.QUARANTINE_FILE)
+    parser.add_argument('files', nargs='+')
+    args = parser.parse_args(argv[1:])
+    files = [f for f in args.files if skeleton_parser.isJson(f)]
+    skeleton_parser.schemaFile = args.schema
+    quarantine = skeleton_parser.Quarantine(args.quarantine)
+
+    conn = connect(args.db, args.fast)
+    if args.create:
+        runScript(conn, CREATE_SQL)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if args.incremental:
+            counts, skipped = loadIncremental(conn, files, cacheDir=args.cache,
+                    quarantine=quarantine)
+        else:
+            counts, skipped = loadJson(conn, files, cacheDir=args.cache, quarantine=quarantine), []
+            recordFiles(conn, [(os.path.abspath(f), skeleton_parser.fileDigest(f)) for f in files])
+    except:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+    if args.create:
+        # indexes, statuses and the search index are built in one go once the
+        # rows are in, not row by row, and the triggers only guard what comes after
+        for path in AFTER_CREATE:
+            runScript(conn, path)
+    conn.close()
+    quarantine.close()
+    for path in skipped:
+        print "Skipped unchanged " + path
+    for relation in skeleton_parser.RELATIONS:
+        print "Loaded %d rows into %s" % (counts[relation], TABLES[relation])
+    if quarantine.count:
+        print >> sys.stderr, 'Quarantined %d malformed items in %s' % (quarantine.count, quarantine.path)
+
+if __name__ == '__main__':
+    main(sys.argv)
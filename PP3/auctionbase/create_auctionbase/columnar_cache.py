@@ -0,0 +1,313 @@
+"""
+FILE: columnar_cache.py
+------------------
+Binary columnar cache of parsed eBay json files. The rows skeleton_parser.py
+extracts from a json file are stored column by column under a directory named
+after the SHA-1 digest of the file and of the schema it was decoded with, so
+an unchanged file never has to be decoded again:
+
+    <cache dir>/<digest>/meta.json        row count of every relation
+    <cache dir>/<digest>/<relation>.<n>   column n of a relation, as an array
+    <cache dir>/<digest>/strings.bin      every distinct string, utf-8 encoded
+                                          and separated by NUL bytes
+    <cache dir>/sources/<path hash>       size, mtime and digest of a json file
+
+The sources entries let a json file whose size and mtime are unchanged be
+looked up without hashing it again.
+
+Integer columns are arrays of signed longs and dollar columns arrays of cents.
+String columns hold indexes into the string pool, where each distinct string
+is stored once however often it occurs. NULL is -1 in a dollar column and 0 in
+a string column, the pool starting with a None. A cache is read back with one
+array.fromfile per column and a single decode of the pool, after which every
+column is turned back into strings with map, without a Python level step per
+value.
+
+A file is only cached when every value converts losslessly, i.e. integers are
+plain decimal strings, dollar amounts have exactly two decimals and no string
+contains a NUL, so rows read back from the cache are identical to freshly
+parsed ones.
+
+The same layout, minus the sources entries, is the output of
+skeleton_parser.py --format columnar (see ColumnarSink), which holds the
+unique rows of all the files parsed in a single directory.
+"""
+
+import os
+import json
+import hashlib
+import shutil
+import tempfile
+from array import array
+from itertools import izip
+
+CACHE_VERSION = 2
+
+# Storage of every column, in the order of skeleton_parser.ItemDecoder.itemRows
+INT, DOLLAR, STRING = range(3)
+CACHE_COLUMNS = {
+    'items': [INT, STRING, DOLLAR, DOLLAR, DOLLAR, INT, STRING, STRING, STRING, STRING],
+    'categories': [INT, STRING],
+    'bids': [INT, STRING, DOLLAR, STRING],
+    'users': [STRING, INT, STRING, STRING],
+}
+
+# Array type code of each kind of column
+TYPECODES = {INT: 'l', DOLLAR: 'l', STRING: 'l'}
+
+# Separator of the strings in strings.bin
+POOL_SEPARATOR = u'\x00'
+
+# Value of NULL in a dollar column
+NULL_CENTS = -1
+
+"""
+Returns the directory a json file with the given digest is cached under
+"""
+def cachePath(cacheDir, digest):
+    return os.path.join(cacheDir, digest)
+
+"""
+Returns the file under cacheDir remembering the digest of the json file at path
+"""
+def sourcePath(cacheDir, path):
+    return os.path.join(cacheDir, 'sources', hashlib.sha1(os.path.abspath(path)).hexdigest())
+
+"""
+Returns the digest of the json file at path, computed with fileDigest unless
+the file is unchanged since the digest was last remembered in cacheDir
+"""
+def sourceDigest(cacheDir, path, fileDigest):
+    st = os.stat(path)
+    stamp = '%d %r' % (st.st_size, st.st_mtime)
+    source = sourcePath(cacheDir, path)
+    try:
+        with open(source, 'r') as f:
+            remembered, digest = f.read().rsplit(' ', 1)
+        if remembered == stamp:
+            return digest
+    except (IOError, ValueError):
+        pass
+    digest = fileDigest(path)
+    if not os.path.isdir(os.path.dirname(source)):
+        try:
+            os.makedirs(os.path.dirname(source))
+        except OSError:
+            pass
+    fd, scratch = tempfile.mkstemp(prefix='.partial-', dir=os.path.dirname(source))
+    with os.fdopen(fd, 'w') as f:
+        f.write('%s %s' % (stamp, digest))
+    os.rename(scratch, source)
+    return digest
+
+"""
+Accumulates rows column by column in memory, to be saved as a columnar
+directory with save
+"""
+class ColumnWriter(object):
+    def __init__(self):
+        self.columns = dict((relation, [array(TYPECODES[kind]) for kind in kinds])
+                for relation, kinds in CACHE_COLUMNS.items())
+        self.strings = {None: 0}
+        self.lossless = True
+
+    def intern(self, value):
+        index = self.strings.get(value)
+        if index is None:
+            if POOL_SEPARATOR in value:
+                self.lossless = False
+                return 0
+            index = self.strings[value] = len(self.strings)
+        return index
+
+    def add(self, relation, row):
+        if not self.lossless:
+            return
+        for column, kind, value in zip(self.columns[relation], CACHE_COLUMNS[relation], row):
+            if kind == STRING:
+                column.append(self.intern(value))
+                continue
+            try:
+                if kind == DOLLAR:
+                    number = NULL_CENTS if value is None else int(round(float(value) * 100))
+                    lossless = value is None or dollarText(number) == value
+                else:
+                    number = int(value)
+                    lossless = str(number) == value
+                if lossless:
+                    column.append(number)
+            except (TypeError, ValueError, OverflowError):
+                # dirty values such as an empty amount are left to the json
+                lossless = False
+            if not lossless:
+                self.lossless = False
+                return
+
+    """
+    Writes the columns into a scratch directory next to path and moves it in
+    place, so readers never see half of one. Returns False when the rows could
+    not be stored losslessly, and leaves path alone when it already exists.
+    """
+    def save(self, path):
+        if not self.lossless:
+            return False
+        parent = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+        scratch = tempfile.mkdtemp(prefix='.partial-', dir=parent)
+        try:
+            pool = [None] * len(self.strings)
+            for value, index in self.strings.items():
+                pool[index] = value
+            with open(os.path.join(scratch, 'strings.bin'), 'wb') as f:
+                f.write(POOL_SEPARATOR.join(pool[1:]).encode('utf-8'))
+            for relation, columns in self.columns.items():
+                for n, column in enumerate(columns):
+                    with open(os.path.join(scratch, '%s.%d' % (relation, n)), 'wb') as f:
+                        column.tofile(f)
+            meta = {'version': CACHE_VERSION, 'strings': len(pool),
+                    'rows': dict((relation, len(columns[0]))
+                        for relation, columns in self.columns.items())}
+            with open(os.path.join(scratch, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+            os.rename(scratch, path)
+        except OSError:
+            # another process saved the same columns first
+            shutil.rmtree(scratch, ignore_errors=True)
+            if not os.path.isdir(path):
+                raise
+        return True
+
+"""
+Accumulates the rows of one json file and writes them out as its cache. Until
+close is called nothing is visible under the cache directory.
+"""
+class CacheWriter(ColumnWriter):
+    def __init__(self, cacheDir, digest):
+        ColumnWriter.__init__(self)
+        self.path = cachePath(cacheDir, digest)
+
+    def close(self):
+        return self.save(self.path)
+
+"""
+Returns the names of the files of a columnar directory
+"""
+def columnFiles():
+    return ['meta.json', 'strings.bin'] + ['%s.%d' % (relation, n)
+            for relation, kinds in CACHE_COLUMNS.items() for n in range(len(kinds))]
+
+"""
+Output sink of skeleton_parser.py writing the unique rows of every relation to
+a single columnar directory at outdir, in the layout of a cache entry. It can
+be read back with readRows. An existing outdir is only replaced when it is the
+output of an earlier columnar run, i.e. holds a meta.json, and anything else
+there is refused before any file is parsed.
+"""
+class ColumnarSink(ColumnWriter):
+    def __init__(self, outdir):
+        ColumnWriter.__init__(self)
+        self.outdir = os.path.abspath(outdir)
+        if os.path.lexists(self.outdir) and not os.path.isfile(os.path.join(self.outdir, 'meta.json')):
+            raise IOError('%s exists and is not a columnar directory, pass another --out' % outdir)
+
+    def write(self, relation, row):
+        self.add(relation, row)
+
+    """
+    Saves the columns at outdir. An earlier columnar directory there is first
+    moved aside, put back if the save fails, and only its own files are
+    removed once the new one is in place.
+    """
+    def close(self):
+        if not self.lossless:
+            raise ValueError('rows cannot be stored losslessly in columnar format')
+        if not os.path.isdir(self.outdir):
+            self.save(self.outdir)
+            return
+        aside = tempfile.mkdtemp(prefix='.replaced-', dir=os.path.dirname(self.outdir))
+        previous = os.path.join(aside, 'columns')
+        os.rename(self.outdir, previous)
+        try:
+            self.save(self.outdir)
+        except:
+            os.rename(previous, self.outdir)
+            os.rmdir(aside)
+            raise
+        for name in columnFiles():
+            try:
+                os.remove(os.path.join(previous, name))
+            except OSError:
+                pass
+        try:
+            os.rmdir(previous)
+            os.rmdir(aside)
+        except OSError:
+            # files that are not part of the layout were added in the meantime
+            pass
+
+"""
+Returns the text of an amount of cents, as transformDollar writes it
+"""
+def dollarText(cents):
+    return u'%d.%02d' % divmod(cents, 100)
+
+"""
+Reads the string pool of the cache at path, NULL first
+"""
+def readPool(path, count):
+    with open(os.path.join(path, 'strings.bin'), 'rb') as f:
+        data = f.read().decode('utf-8')
+    return [None] + (data.split(POOL_SEPARATOR) if count > 1 else [])
+
+"""
+Returns the columns saved at path as (pool, columns), columns mapping each
+relation to its list of arrays, or None when there are none
+"""
+def readColumns(path):
+    try:
+        with open(os.path.join(path, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+    except IOError:
+        return None
+    if meta['version'] != CACHE_VERSION:
+        return None
+    columns = {}
+    for relation, kinds in CACHE_COLUMNS.items():
+        columns[relation] = []
+        for n, kind in enumerate(kinds):
+            column = array(TYPECODES[kind])
+            with open(os.path.join(path, '%s.%d' % (relation, n)), 'rb') as f:
+                column.fromfile(f, meta['rows'][relation])
+            columns[relation].append(column)
+    return readPool(path, meta['strings']), columns
+
+"""
+Converts the cached columns of a relation back into rows of strings, exactly
+as skeleton_parser.ItemDecoder.itemRows produced them. Dollar amounts repeat a lot, so
+each distinct one is formatted once.
+"""
+def columnRows(pool, relation, columns):
+    decoded = []
+    for kind, column in zip(CACHE_COLUMNS[relation], columns):
+        if kind == STRING:
+            decoded.append(map(pool.__getitem__, column))
+        elif kind == DOLLAR:
+            texts = dict((cents, dollarText(cents)) for cents in set(column))
+            texts[NULL_CENTS] = None
+            decoded.append(map(texts.__getitem__, column))
+        else:
+            decoded.append(map(unicode, column))
+    return izip(*decoded)
+
+"""
+Returns the (relation, row) pairs of the columns saved at path, relation by
+relation, or None when there are none
+"""
+def readRows(path, relations):
+    cached = readColumns(path)
+    if cached is None:
+        return None
+    pool, columns = cached
+    return ((relation, row) for relation in relations
+            for row in columnRows(pool, relation, columns[relation]))
@@ -3,6 +3,8 @@ DROP TABLE IF EXISTS Categories;
 DROP TABLE IF EXISTS Bids;
 DROP TABLE IF EXISTS Users;
 DROP TABLE IF EXISTS CurrentTime;
+DROP TABLE IF EXISTS LoadedFiles;
+DROP TABLE IF EXISTS ItemsSearch;
 
 CREATE TABLE Items (
    ItemID INTEGER,
@@ -50,6 +52,12 @@ CREATE TABLE CurrentTime (
    Time TEXT
 );
 
+CREATE TABLE LoadedFiles (
+   Path TEXT,
+   Digest TEXT,
+   PRIMARY KEY(Path)
+);
+
 SELECT Time FROM CurrentTime;
 
 INSERT into CurrentTime values ('2001-12-20 00:00:01');
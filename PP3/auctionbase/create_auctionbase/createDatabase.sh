@@ -1,11 +1,8 @@
 sqlite3 AuctionBase < create.sql
 sqlite3 AuctionBase < load.txt
+sqlite3 AuctionBase < indexes_add.sql
+sqlite3 AuctionBase < status_add.sql
 sqlite3 AuctionBase < constraints_verify.sql
 sqlite3 AuctionBase < trigger1_add.sql
-sqlite3 AuctionBase < trigger2_add.sql
-sqlite3 AuctionBase < trigger3_add.sql
-sqlite3 AuctionBase < trigger4_add.sql
-sqlite3 AuctionBase < trigger5_add.sql
-sqlite3 AuctionBase < trigger6_add.sql
-sqlite3 AuctionBase < trigger7_add.sql
-sqlite3 AuctionBase < trigger8_add.sql
+sqlite3 AuctionBase < bid_triggers_add.sql
+sqlite3 AuctionBase < fts_add.sql
@@ -0,0 +1,38 @@
+-- description: Full-text index of item descriptions for search
+
+PRAGMA foreign_keys = ON;
+
+drop trigger if exists ItemsSearchInsert;
+drop trigger if exists ItemsSearchDelete;
+drop trigger if exists ItemsSearchUpdate;
+drop table if exists ItemsSearch;
+
+-- External content table: only the index is stored, the text stays in Items.
+-- The rowid of an entry is the ItemID of its item.
+create virtual table ItemsSearch using fts5(
+	Description,
+	content = 'Items',
+	content_rowid = 'ItemID',
+	tokenize = 'porter unicode61'
+);
+
+insert into ItemsSearch(ItemsSearch) values ('rebuild');
+
+create trigger ItemsSearchInsert
+	after insert on Items
+	begin
+		insert into ItemsSearch(rowid, Description) values (NEW.ItemID, NEW.Description);
+	end;
+
+create trigger ItemsSearchDelete
+	after delete on Items
+	begin
+		insert into ItemsSearch(ItemsSearch, rowid, Description) values ('delete', OLD.ItemID, OLD.Description);
+	end;
+
+create trigger ItemsSearchUpdate
+	after update of ItemID, Description on Items
+	begin
+		insert into ItemsSearch(ItemsSearch, rowid, Description) values ('delete', OLD.ItemID, OLD.Description);
+		insert into ItemsSearch(rowid, Description) values (NEW.ItemID, NEW.Description);
+	end;
@@ -0,0 +1,6 @@
+PRAGMA foreign_keys = ON;
+
+drop trigger ItemsSearchInsert;
+drop trigger ItemsSearchDelete;
+drop trigger ItemsSearchUpdate;
+drop table ItemsSearch;
@@ -0,0 +1,30 @@
+-- description: Secondary indexes on the columns searchAuctions, the triggers
+-- and the foreign keys look rows up by. Built once the data is loaded.
+
+PRAGMA foreign_keys = ON;
+
+drop index if exists ItemsCurrently;
+drop index if exists ItemsStarted;
+drop index if exists ItemsEnds;
+drop index if exists ItemsSeller;
+drop index if exists CategoriesCategory;
+drop index if exists BidsUser;
+
+-- price range searches, paged cheapest first. Every entry ends with the rowid,
+-- which is the ItemID, so the index is in (Currently, ItemID) order, the order
+-- of the keyset of a page.
+create index ItemsCurrently on Items(Currently);
+
+-- status searches, against CurrentTime
+create index ItemsStarted on Items(Started);
+create index ItemsEnds on Items(Ends);
+
+-- foreign keys to Users, checked whenever a user is deleted or renamed
+create index ItemsSeller on Items(Seller_UserID);
+create index BidsUser on Bids(UserID);
+
+-- category searches
+create index CategoriesCategory on Categories(Category);
+
+-- statistics for the planner to choose between the indexes of Items
+analyze;
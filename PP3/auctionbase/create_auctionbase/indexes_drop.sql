@@ -0,0 +1,8 @@
+PRAGMA foreign_keys = ON;
+
+drop index ItemsCurrently;
+drop index ItemsStarted;
+drop index ItemsEnds;
+drop index ItemsSeller;
+drop index BidsUser;
+drop index CategoriesCategory;
@@ -24,16 +24,165 @@ you; the rest is up to you!
 Happy parsing!
 """
 
+import os
 import sys
-from json import loads
-from re import sub
+import re
+import shutil
+import hashlib
+import marshal
+import argparse
+import tempfile
+from itertools import islice
+from multiprocessing import Pool
+from json import loads, dumps, JSONDecoder
+from json.scanner import py_make_scanner
+
+import columnar_cache
 
 columnSeparator = "|"
 
+# Relations of the AuctionBase schema, in the order their rows are produced
+RELATIONS = ['items', 'categories', 'bids', 'users']
+
+# Output file of each relation, in the order parseJson opens them
+DAT_FILES = ['items.dat', 'categories.dat', 'bids.dat', 'users.dat']
+
+# How each column of a relation is written to its .dat file: PLAIN as is,
+# QUOTED wrapped in double quotes, ESCAPED quoted with embedded double quotes
+# doubled. Missing values of DAT_NULLABLE columns are written as DAT_NULL.
+PLAIN, QUOTED, ESCAPED = range(3)
+DAT_COLUMNS = {
+    'items': [PLAIN, ESCAPED, PLAIN, PLAIN, PLAIN, PLAIN, QUOTED, QUOTED, QUOTED, ESCAPED],
+    'categories': [PLAIN, QUOTED],
+    'bids': [PLAIN, QUOTED, PLAIN, QUOTED],
+    'users': [QUOTED, PLAIN, ESCAPED, QUOTED],
+}
+
+# Columns of each relation that may be missing from an item and so be NULL
+DAT_NULLABLE = {'items': (4, 9), 'categories': (), 'bids': (), 'users': (2, 3)}
+
+# Characters of lines buffered by a DatWriter before they are written out in
+# one go. Items lines carry whole descriptions, so the buffer is bounded by its
+# size rather than by a count of rows. Lines are unicode, at four bytes a
+# character, and are copied once more when joined.
+WRITE_BUFFER_SIZE = 1 << 16
+
+# Unquoted marker for a NULL value in the .dat files, distinct from an empty
+# string which is written as "". load.txt turns it back into NULL on import.
+# .import strips the quotes of a value before load.txt sees it, so a value of
+# a nullable column made of backslashes and a final N, such as the text \N,
+# is written with one more leading backslash, which load.txt takes off again.
+DAT_NULL = '\\N'
+
+# Dedup key of a row of each relation: ItemID for items, (ItemID, Category)
+# for categories, (ItemID, UserID, Amount) for bids and UserID for users
+ROW_KEYS = {
+    'items': lambda row: row[0],
+    'categories': lambda row: row,
+    'bids': lambda row: row[:3],
+    'users': lambda row: row[0],
+}
+
+# Suffix of the file next to each .dat file of a shard holding the key and the
+# number of lines of every row in it, in order
+SHARD_KEYS_SUFFIX = '.keys'
+
+# Output formats of the parser, each with the module and factory of its sink
+# and the default output path. A sink takes the unique rows of every relation
+# with write(relation, row) and is closed once all the files are parsed.
+SINKS = {
+    'dat': ('skeleton_parser', 'DatSink', '.'),
+    'sqlite': ('bulk_loader', 'openSqliteSink', 'AuctionBase'),
+    'columnar': ('columnar_cache', 'ColumnarSink', 'columns'),
+}
+
+# Schema the items of a json file are decoded with, read from the file
+# SCHEMA_FILE next to it unless schemaFile is set. Files with no schema next to
+# them are decoded with the one of the eBay data that comes with the project.
+SCHEMA_FILE = 'items_schema.txt'
+DEFAULT_SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+        'ebay_data', SCHEMA_FILE)
+schemaFile = None
+
+# Decoders compiled so far, by schema path
+decoders = {}
+
+# Path of each object of an item within the schema
+SCHEMA_OBJECTS = {
+    'item': ['items'],
+    'seller': ['items', 'properties', 'Seller'],
+    'bid': ['items', 'properties', 'Bids', 'items'],
+    'bidder': ['items', 'properties', 'Bids', 'items', 'properties', 'Bidder'],
+}
+
+# Fields that are stored as NULL when missing. The schema can only make these
+# optional; any other field is always looked up as required.
+NULLABLE_FIELDS = set(['item.Buy_Price', 'item.Description', 'item.Location', 'item.Country',
+        'bidder.Location', 'bidder.Country'])
+
+# Source of ItemDecoder.itemRows. Every %(object.Field)s is replaced by the
+# lookup of that field the schema calls for. Each bid of the data is wrapped in
+# a {"Bid": ...} object the schema leaves out.
+DECODER_SOURCE = '''
+def itemRows(item):
+    itemID = %(item.ItemID)s
+    seller = %(item.Seller)s
+    if %(item.Number_of_Bids)s != "0":
+        bids = [bidsIterator['Bid'] for bidsIterator in %(item.Bids)s]
+    else:
+        bids = []
+    bidders = [%(bid.Bidder)s for bid in bids]
+    rows = [('items', (itemID, %(item.Name)s, transformDollar(%(item.Currently)s),
+            transformDollar(%(item.First_Bid)s), transformDollar(%(item.Buy_Price)s),
+            %(item.Number_of_Bids)s, transformDttm(%(item.Started)s), transformDttm(%(item.Ends)s),
+            %(seller.UserID)s, %(item.Description)s))]
+    for category in %(item.Category)s:
+        rows.append(('categories', (itemID, textField(category, 'item.Category'))))
+    for bid, bidder in zip(bids, bidders):
+        rows.append(('bids', (itemID, %(bidder.UserID)s,
+                transformDollar(%(bid.Amount)s), transformDttm(%(bid.Time)s))))
+    rows.append(('users', (%(seller.UserID)s, %(seller.Rating)s, %(item.Location)s, %(item.Country)s)))
+    for bidder in bidders:
+        rows.append(('users', (%(bidder.UserID)s, %(bidder.Rating)s,
+                %(bidder.Location)s, %(bidder.Country)s)))
+    return rows
+'''
+
+# File malformed items are appended to, one json object per line
+QUARANTINE_FILE = 'quarantine.json'
+
+# Number of bytes read at a time when streaming items out of a json file
+STREAM_CHUNK_SIZE = 1 << 16
+
+# Number of bytes read at a time when computing the digest of a json file
+DIGEST_CHUNK_SIZE = 1 << 20
+
+# Whitespace and separators allowed between two items of the Items array
+ITEM_GAP = re.compile(r'[\s,]*')
+
+# Offset a json decoding error points at, and the errors that mean the text
+# ran out rather than being malformed
+ERROR_OFFSET = re.compile(r'\(char (\d+)\)')
+TRUNCATION_ERRORS = ('Unterminated string', 'end is out of bounds')
+
+# Length of the longest json literal, false
+LITERAL_LENGTH = 5
+
 # Dictionary of months used for date transformation
 MONTHS = {'Jan':'01','Feb':'02','Mar':'03','Apr':'04','May':'05','Jun':'06',\
         'Jul':'07','Aug':'08','Sep':'09','Oct':'10','Nov':'11','Dec':'12'}
 
+# Characters stripped from dollar amounts
+NON_DECIMAL = re.compile(r'[^\d.]')
+
+# Memos of converted dollar amounts, keyed by the raw amount, and of converted
+# dates, keyed by the 'Mon-DD-YY ' prefix of a timestamp. The same few thousand
+# amounts and days come up again and again across items and bids. A memo is
+# emptied whenever it reaches MEMO_SIZE entries to keep its size bounded.
+MEMO_SIZE = 1 << 16
+dollarMemo = {}
+dateMemo = {}
+
 """
 Returns true if a file ends in .json
 """
@@ -50,112 +199,608 @@ def transformMonth(mon):
         return mon
 
 """
-Transforms a timestamp from Mon-DD-YY HH:MM:SS to YYYY-MM-DD HH:MM:SS
+Transforms a timestamp from Mon-DD-YY HH:MM:SS to YYYY-MM-DD HH:MM:SS.
+The 'Mon-DD-YY ' prefix of a timestamp is looked up in dateMemo, which only
+ever holds prefixes of exactly that shape, so a hit on a timestamp of the right
+length needs no further check. On a miss the shape is checked once: a prefix
+of that shape is rewritten at fixed offsets and remembered, and a timestamp of
+any other shape is split apart field by field, whatever the memo holds.
 """
 def transformDttm(dttm):
-    dttm = dttm.strip().split(' ')
-    dt = dttm[0].split('-')
-    date = '20' + dt[2] + '-'
-    date += transformMonth(dt[0]) + '-' + dt[1]
-    return date + ' ' + dttm[1]
+    date = dateMemo.get(dttm[:10])
+    if date is None or len(dttm) != 18:
+        if len(dttm) != 18 or dttm[3] != '-' or dttm[6] != '-' or dttm[9] != ' ':
+            dttm = dttm.strip().split(' ')
+            dt = dttm[0].split('-')
+            date = '20' + dt[2] + '-'
+            date += transformMonth(dt[0]) + '-' + dt[1]
+            return date + ' ' + dttm[1]
+        if len(dateMemo) >= MEMO_SIZE:
+            dateMemo.clear()
+        date = dateMemo[dttm[:10]] = '20' + dttm[7:9] + '-' + transformMonth(dttm[:3]) + '-' + dttm[4:6] + ' '
+    return date + dttm[10:]
 
 """
 Transform a dollar value amount from a string like $3,453.23 to XXXXX.xx
 """
 
 def transformDollar(money):
-    if money == None or len(money) == 0:
-        return money
-    return sub(r'[^\d.]', '', money)
+    converted = dollarMemo.get(money)
+    if converted is None:
+        if money == None or len(money) == 0:
+            return money
+        if len(dollarMemo) >= MEMO_SIZE:
+            dollarMemo.clear()
+        converted = dollarMemo[money] = NON_DECIMAL.sub('', money)
+    return converted
 
 """
-Parses a single json file. Currently, there's a loop that iterates over each
-item in the data set. Your job is to extend this functionality to create all
-of the necessary SQL tables for your database.
+Returns every item of an open json file at once, decoding the whole file into
+memory first
+"""
+def loadItems(f):
+    return loads(f.read())['Items']
+
+"""
+Returns the error decoding the item at pos in buf runs into, as a pair of its
+message and the offset in buf it points at, or None when decoding only ran
+out of buf and more of the file may complete the item. The pure Python scanner
+is used because the messages of the C one often leave the offset out. A cut
+literal such as nul is reported at its start, so offsets within
+LITERAL_LENGTH of the end of buf count as running out of it too.
+"""
+def itemError(buf, pos):
+    decoder = JSONDecoder()
+    decoder.scan_once = py_make_scanner(decoder)
+    try:
+        decoder.raw_decode(buf, pos)
+    except ValueError as e:
+        message = str(e)
+        if message.startswith(TRUNCATION_ERRORS):
+            return None
+        # an item that does not even start like one is reported without offset
+        offset = ERROR_OFFSET.search(message)
+        offset = pos if offset is None else int(offset.group(1))
+        if offset >= len(buf) - LITERAL_LENGTH:
+            return None
+        return message.split(':', 1)[0], offset
+    return None
+
+"""
+Yields the items of an open json file one at a time. The file is read in
+chunks of chunkSize bytes and only the unconsumed tail of the current chunk is
+kept around, so memory use stays flat no matter how large the file is. A
+further chunk is only read when an item is cut off by the end of the buffer;
+a malformed item raises ValueError with the offset in the file of the error.
+"""
+def streamItems(f, chunkSize=STREAM_CHUNK_SIZE):
+    decoder = JSONDecoder()
+    buf = ''
+    pos = -1
+    # skip ahead to the opening bracket of the Items array
+    while pos < 0:
+        chunk = f.read(chunkSize)
+        if not chunk:
+            raise ValueError('no Items array in ' + f.name)
+        buf += chunk
+        key = buf.find('"Items"')
+        if key >= 0:
+            pos = buf.find('[', key)
+    pos += 1
+    # characters of the file before buf
+    consumed = 0
+    while True:
+        pos = ITEM_GAP.match(buf, pos).end()
+        if pos < len(buf) and buf[pos] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except ValueError:
+            error = itemError(buf, pos)
+            if error is not None:
+                message, offset = error
+                raise ValueError('%s at char %d of %s' % (message, consumed + offset, f.name))
+            # the next item is cut off by the end of the buffer
+            chunk = f.read(chunkSize)
+            if not chunk:
+                raise ValueError('truncated Items array in ' + f.name)
+            consumed += pos
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        yield item
+        pos = end
+
+"""
+Returns the hex SHA-1 digest of the contents of a file
+"""
+def fileDigest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DIGEST_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+"""
+Returns the items of a json file opened as f, either streamed one at a time or
+all decoded at once
+"""
+def readItems(f, stream=False):
+    if stream:
+        return streamItems(f)
+    return loadItems(f) # creates a Python dictionary of Items for the supplied json file
+
+"""
+Raised for an item that does not fit the schema
+"""
+class MalformedItem(Exception):
+    pass
+
+"""
+Returns the value of an array field, raising MalformedItem unless it is a
+list. A null array is taken as an empty one.
+"""
+def listField(value, name):
+    if value is None:
+        return ()
+    if type(value) is not list:
+        raise MalformedItem('%s is not an array' % name)
+    return value
+
+"""
+Returns the value of a scalar field, raising MalformedItem unless it is a
+string. Numbers are stored as strings throughout the data, so the number type
+the schema gives some fields is not enforced.
+"""
+def textField(value, name):
+    if not isinstance(value, basestring):
+        raise MalformedItem('%s is %s, not a string' % (name,
+                'null' if value is None else type(value).__name__))
+    return value
+
+"""
+Returns the value of a scalar field that can be NULL, raising MalformedItem
+unless it is a string or null
+"""
+def nullableTextField(value, name):
+    if value is None:
+        return None
+    return textField(value, name)
+
+"""
+Returns the fields of every object of an item in schema, the parsed contents of
+an items_schema.txt, as a dictionary from 'object.Field' to a pair of whether
+the field is required and its type. The Bid object keeps its list of required
+fields among its properties, so it is looked for there too.
+"""
+def schemaFields(schema):
+    fields = {}
+    for name, path in SCHEMA_OBJECTS.items():
+        node = schema
+        for key in path:
+            node = node[key]
+        properties = node.get('properties', {})
+        required = node.get('required') or properties.get('required') or []
+        for field, spec in properties.items():
+            if isinstance(spec, dict):
+                fields[name + '.' + field] = (field in required, spec.get('type'))
+    return fields
+
+"""
+Item decoder compiled from the items schema at path. DECODER_SOURCE is filled
+in with one lookup per field, as given by __getitem__, and executed once, so
+each item is walked exactly once by a plain function with no per-field checks
+beyond what the schema asks for.
+
+itemRows converts one item into the rows it contributes to each relation. It
+returns a (relation, row) pair per row; rows are tuples of strings in the
+column order of create.sql, with None for values missing from the item. An
+item that does not fit the schema raises MalformedItem.
+"""
+class ItemDecoder(object):
+    def __init__(self, path):
+        with open(path, 'r') as f:
+            text = f.read()
+        self.digest = hashlib.sha1(text).hexdigest()
+        # the descriptions in items_schema.txt span lines, which strict json forbids
+        self.fields = schemaFields(loads(text, strict=False))
+        namespace = {'transformDollar': transformDollar, 'transformDttm': transformDttm,
+                'listField': listField, 'textField': textField,
+                'nullableTextField': nullableTextField}
+        exec DECODER_SOURCE % self in namespace
+        self.decode = namespace['itemRows']
+
+    """
+    Returns the expression looking up a field, given as 'object.Field', in the
+    decoder: a subscript for a required field, a get for an optional one that
+    can be NULL, wrapped in listField when the field is an array and in
+    textField, or nullableTextField for a field that can be NULL, when it is
+    neither an array nor an object
+    """
+    def __getitem__(self, name):
+        obj, field = name.split('.')
+        required, kind = self.fields.get(name, (True, None))
+        if required or name not in NULLABLE_FIELDS:
+            lookup = '%s[%r]' % (obj, field)
+        else:
+            lookup = '%s.get(%r)' % (obj, field)
+        if kind == 'array':
+            lookup = 'listField(%s, %r)' % (lookup, name)
+        elif kind != 'object':
+            check = 'nullableTextField' if name in NULLABLE_FIELDS else 'textField'
+            lookup = '%s(%s, %r)' % (check, lookup, name)
+        return lookup
+
+    def itemRows(self, item):
+        try:
+            return self.decode(item)
+        except MalformedItem:
+            raise
+        except KeyError as e:
+            raise MalformedItem('missing field %s' % e.args[0])
+        except (TypeError, AttributeError, ValueError, IndexError) as e:
+            raise MalformedItem('%s: %s' % (type(e).__name__, e))
+
+"""
+Returns the decoder of the json file at path, compiled from schemaFile or else
+from the items_schema.txt next to the file, or DEFAULT_SCHEMA_FILE when there
+is none. Decoders are compiled once per schema.
+"""
+def itemDecoder(json_file):
+    path = schemaFile or os.path.join(os.path.dirname(json_file), SCHEMA_FILE)
+    if not schemaFile and not os.path.isfile(path):
+        path = DEFAULT_SCHEMA_FILE
+    if path not in decoders:
+        if not os.path.isfile(path):
+            raise IOError('no items schema at %s, pass one with --schema' % path)
+        decoders[path] = ItemDecoder(path)
+    return decoders[path]
+
+"""
+Appends the items that do not fit the schema to the file at path, one json
+object per line with the file each came from and what is wrong with it. The
+file is only created once there is something to put in it.
+"""
+class Quarantine(object):
+    def __init__(self, path=QUARANTINE_FILE):
+        self.path = path
+        self.out = None
+        self.count = 0
+
+    def add(self, json_file, item, reason):
+        if self.out is None:
+            self.out = open(self.path, 'a')
+        self.out.write(dumps({'file': json_file, 'error': reason, 'item': item}) + '\n')
+        self.count += 1
+
+    """
+    Appends the items quarantined to another file at path, as parseShard leaves
+    them in a shard
+    """
+    def merge(self, path):
+        if not os.path.exists(path):
+            return
+        with open(path, 'r') as f:
+            for line in f:
+                if self.out is None:
+                    self.out = open(self.path, 'a')
+                self.out.write(line)
+                self.count += 1
+
+    def close(self):
+        if self.out is not None:
+            self.out.close()
+
+"""
+Returns an empty set of already written keys for every relation. Passing the
+same one to several parseJson calls writes each unique row exactly once across
+all of them, which is what the sort -u passes over the .dat files used to do.
 """
-def parseJson(json_file):
+def newSeenKeys():
+    return dict((relation, set()) for relation in RELATIONS)
+
+"""
+Yields the (relation, row) pairs of every item of a json file. Items that do
+not fit the schema are added to quarantine, or raise MalformedItem when there
+is none. Given a cacheDir, the rows come from the columnar cache of the file
+when it has one, and are cached on the way through when it does not. A file
+with quarantined items is never cached, so they are reported on every run.
+"""
+def fileRows(json_file, stream=False, cacheDir=None, quarantine=None):
+    decoder = itemDecoder(json_file)
+    writer = None
+    if cacheDir is not None:
+        # rows depend on both the file and the schema it is decoded with
+        digest = hashlib.sha1(columnar_cache.sourceDigest(cacheDir, json_file, fileDigest)
+                + decoder.digest).hexdigest()
+        cached = columnar_cache.readRows(columnar_cache.cachePath(cacheDir, digest), RELATIONS)
+        if cached is not None:
+            for pair in cached:
+                yield pair
+            return
+        writer = columnar_cache.CacheWriter(cacheDir, digest)
+    clean = True
     with open(json_file, 'r') as f:
-        items = loads(f.read())['Items'] # creates a Python dictionary of Items for the supplied json file
-        f1 = open('items.dat', 'a')
-        f2 = open('categories.dat', 'a')
-        f3 = open('bids.dat', 'a')
-        f4 = open('users.dat', 'a')
-        for item in items:
-            
-            # Items Table
-            
-           
-
-            f1.write(item['ItemID'] + "|\"")
-            f1.write(item['Name'].replace('\"', '\"\"') + "\"|")
-            f1.write(transformDollar(item['Currently']) + "|")
-            f1.write(transformDollar(item['First_Bid']) + "|")
+        for item in readItems(f, stream):
             try:
-                f1.write(transformDollar(item['Buy_Price']) + "|")
-            except KeyError:
-                f1.write("-999" + "|")
-            f1.write(item['Number_of_Bids'] + "|\"")
-            f1.write(transformDttm(item['Started']) + "\"|\"")
-            f1.write(transformDttm(item['Ends']) + "\"|\"")
-            seller = item['Seller']
-            f1.write(seller['UserID'] + "\"|\"")
-            if item['Description'] is not None:
-                f1.write(str(item['Description'].replace('\"', '\"\"')) + "\"\n")
+                rows = decoder.itemRows(item)
+            except MalformedItem as e:
+                if quarantine is None:
+                    raise
+                quarantine.add(json_file, item, str(e))
+                clean = False
+                continue
+            for relation, row in rows:
+                if writer is not None:
+                    writer.add(relation, row)
+                yield relation, row
+    if writer is not None and clean:
+        writer.close()
+
+"""
+Yields the (relation, row) pairs of rows whose key, as given by ROW_KEYS, is
+not in seen yet, and adds those keys to seen
+"""
+def uniqueRows(rows, seen):
+    for relation, row in rows:
+        key = ROW_KEYS[relation](row)
+        if key not in seen[relation]:
+            seen[relation].add(key)
+            yield relation, row
+
+"""
+Doubles the double quotes inside a value
+"""
+def escapeQuotes(value):
+    return value.replace('"', '""')
+
+# Formatting of a non-NULL value for each column style of DAT_COLUMNS
+DAT_FIELDS = {
+    PLAIN: lambda value: value,
+    QUOTED: lambda value: '"' + value + '"',
+    ESCAPED: lambda value: '"' + escapeQuotes(value) + '"',
+}
+
+"""
+Returns a value of a nullable column with one more leading backslash when it
+is made of backslashes and a final N, so that it cannot be read as DAT_NULL
+"""
+def escapeNull(value):
+    if value[-1:] == 'N' and len(value) > 1 and not value[:-1].strip('\\'):
+        return '\\' + value
+    return value
+
+"""
+Wraps the formatting of a column so that a missing value becomes DAT_NULL
+"""
+def nullableField(field):
+    return lambda value: DAT_NULL if value is None else field(escapeNull(value))
+
+"""
+Buffered writer of the rows of one relation to its .dat file. Each row is
+formatted into a complete line up front and lines are handed to the file as
+a single joined string once they add up to bufferSize characters.
+
+The line is a single % of a template with the quotes of every column baked
+in. Only the columns that need more than that get a per-field pass first:
+escaped ones have their double quotes doubled, and nullable ones are quoted
+here, or written as DAT_NULL, since a NULL is never quoted, with escapeNull
+keeping a text that looks like DAT_NULL apart from it.
+"""
+class DatWriter(object):
+    def __init__(self, path, relation, bufferSize=WRITE_BUFFER_SIZE):
+        self.out = open(path, 'a')
+        templates, self.fields = [], []
+        for column, style in enumerate(DAT_COLUMNS[relation]):
+            if column in DAT_NULLABLE[relation]:
+                templates.append('%s')
+                self.fields.append((column, nullableField(DAT_FIELDS[style])))
+            elif style == ESCAPED:
+                templates.append('"%s"')
+                self.fields.append((column, escapeQuotes))
             else:
-                f1.write("empty" + "\"\n")
-            
-          
-            # Categories Table
-
-            
-            for category in item['Category']:
-                f2.write(item['ItemID'] + "|\"")
-                f2.write(category + "\"\n")
-            
-            # Bids Table
-            
-            
-            if item['Number_of_Bids'] != "0":
-                bids = item['Bids']
-                for bidsIterator in bids:
-                    f3.write(item['ItemID'] + "|\"")
-                    bid = bidsIterator['Bid']
-                    bidder = bid['Bidder']
-                    f3.write(bidder['UserID'] + "\"|")
-                    f3.write(transformDollar(bid['Amount']) + "|\"")
-                    f3.write(transformDttm(bid['Time']) + "\"\n")
-            
-            
-            # Users Table - Seller
-
-            
-            f4.write("\"" + seller['UserID'] + "\"|")
-            f4.write(seller['Rating'] + "|\"")
-            f4.write(item['Location'].replace('\"', '\"\"') + "\"|\"")
-            f4.write(item['Country'] + "\"\n") 
-
-            # Users Table - Bidder
-
-            if item['Number_of_Bids'] != "0":
-                bids = item['Bids']
-                for bidsIterator in bids:
-                    bid = bidsIterator['Bid']
-                    bidder = bid['Bidder']
-                    f4.write("\"" + bidder['UserID'] + "\"|")
-                    f4.write(bidder['Rating'] + "|\"")
-                    try:
-                        f4.write(bidder['Location'].replace('\"', '\"\"') + "\"|\"")
-                    except KeyError:
-                        f4.write("empty" + "\"|\"")
-                    try:
-                        f4.write(bidder['Country'] + "\"\n")
-                    except KeyError:
-                        f4.write("empty" + "\"\n")
-
-        f1.close()
-        f2.close()
-        f3.close()
-        f4.close()
+                templates.append('%s' if style == PLAIN else '"%s"')
+        self.template = columnSeparator.join(templates) + '\n'
+        self.bufferSize = bufferSize
+        self.lines = []
+        self.buffered = 0
+
+    def format(self, row):
+        if self.fields:
+            row = list(row)
+            for column, field in self.fields:
+                row[column] = field(row[column])
+            row = tuple(row)
+        return self.template % row
+
+    def write(self, row):
+        self.writeLine(self.format(row))
+
+    def writeLine(self, line):
+        self.lines.append(line)
+        self.buffered += len(line)
+        if self.buffered >= self.bufferSize:
+            self.flush()
+
+    def flush(self):
+        self.out.write(''.join(self.lines))
+        del self.lines[:]
+        self.buffered = 0
+
+    def close(self):
+        self.flush()
+        self.out.close()
+
+"""
+Output sink appending the rows of every relation to its .dat file in outdir
+"""
+class DatSink(object):
+    def __init__(self, outdir='.'):
+        self.writers = dict((relation, DatWriter(os.path.join(outdir, name), relation))
+                for relation, name in zip(RELATIONS, DAT_FILES))
+
+    def write(self, relation, row):
+        self.writers[relation].write(row)
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+"""
+Output sink of a shard of parseParallel. Rows go to the .dat files in outdir as
+with DatSink, and the ROW_KEYS key of every row is kept along with the number
+of lines it was written as, since quoted text can span lines. The keys are
+saved next to each .dat file on close, so the shards can be merged row by row.
+"""
+class ShardSink(DatSink):
+    def __init__(self, outdir):
+        DatSink.__init__(self, outdir)
+        self.outdir = outdir
+        self.keys = dict((relation, []) for relation in RELATIONS)
+
+    def write(self, relation, row):
+        writer = self.writers[relation]
+        line = writer.format(row)
+        writer.writeLine(line)
+        self.keys[relation].append((ROW_KEYS[relation](row), line.count('\n')))
+
+    def close(self):
+        DatSink.close(self)
+        for relation, name in zip(RELATIONS, DAT_FILES):
+            with open(os.path.join(self.outdir, name + SHARD_KEYS_SUFFIX), 'wb') as f:
+                marshal.dump(self.keys[relation], f)
+
+"""
+Returns the sink of an output format writing to out, or to the default path of
+the format when out is None. Sink modules are only imported when asked for.
+"""
+def openSink(format, out=None):
+    module, factory, default = SINKS[format]
+    return getattr(__import__(module), factory)(default if out is None else out)
+
+"""
+Parses a single json file. Currently, there's a loop that iterates over each
+item in the data set. Your job is to extend this functionality to create all
+of the necessary SQL tables for your database.
+
+With stream set, items are decoded one at a time as they are written out
+instead of materializing the whole file first. With cacheDir set, rows are
+read from or saved to the columnar cache there. Rows are written to sink, or
+appended to the .dat files in outdir when there is none, skipping any row
+whose key is already in seen. Malformed items go to quarantine.
+"""
+def parseJson(json_file, stream=False, outdir='.', seen=None, cacheDir=None, sink=None,
+        quarantine=None):
+    if seen is None:
+        seen = newSeenKeys()
+    out = DatSink(outdir) if sink is None else sink
+    for relation, row in uniqueRows(fileRows(json_file, stream, cacheDir, quarantine), seen):
+        out.write(relation, row)
+    if sink is None:
+        out.close()
+
+"""
+Parses one json file into a shard directory of its own. Runs inside a worker
+process of parseParallel.
+"""
+def parseShard(task):
+    json_file, shard, stream, cacheDir = task
+    os.mkdir(shard)
+    quarantine = Quarantine(os.path.join(shard, QUARANTINE_FILE))
+    sink = ShardSink(shard)
+    parseJson(json_file, stream, cacheDir=cacheDir, sink=sink, quarantine=quarantine)
+    sink.close()
+    quarantine.close()
+    return json_file, shard
+
+"""
+Parses json files on a pool of jobs worker processes. Every file is parsed into
+its own shard and the shards are appended to the .dat files in outdir in the
+order the files were given, as soon as each one and all the files before it
+are done. Each shard is deduplicated by its worker and rows already merged from
+an earlier shard are dropped by the keys saved with it, a whole row at a time
+however many lines it spans, so the output is byte-identical to parsing the
+files one at a time. The malformed items of every shard are merged into
+quarantine the same way.
+"""
+def parseParallel(files, jobs, stream=False, outdir='.', cacheDir=None, quarantine=None):
+    shardRoot = tempfile.mkdtemp(prefix='shards-', dir=outdir)
+    tasks = [(f, os.path.join(shardRoot, '%06d' % i), stream, cacheDir)
+            for i, f in enumerate(files)]
+    writers = [DatWriter(os.path.join(outdir, name), relation)
+            for relation, name in zip(RELATIONS, DAT_FILES)]
+    seen = newSeenKeys()
+    pool = Pool(jobs)
+    try:
+        # imap hands results back in submission order, whichever worker finishes first
+        for json_file, shard in pool.imap(parseShard, tasks):
+            for relation, name, writer in zip(RELATIONS, DAT_FILES, writers):
+                seenKeys = seen[relation]
+                with open(os.path.join(shard, name + SHARD_KEYS_SUFFIX), 'rb') as f:
+                    keys = marshal.load(f)
+                with open(os.path.join(shard, name), 'r') as part:
+                    for key, count in keys:
+                        line = next(part) if count == 1 else ''.join(islice(part, count))
+                        if key not in seenKeys:
+                            seenKeys.add(key)
+                            writer.writeLine(line)
+            if quarantine is not None:
+                quarantine.merge(os.path.join(shard, QUARANTINE_FILE))
+            shutil.rmtree(shard)
+            print "Success parsing " + json_file
+    finally:
+        pool.terminate()
+        pool.join()
+        for writer in writers:
+            writer.close()
+        shutil.rmtree(shardRoot)
+
+"""
+Parses one json file into the columnar cache. Runs inside a worker process of
+cacheParallel. Files with malformed items are not cached, so those items are
+left for the main process to quarantine.
+"""
+def cacheShard(task):
+    json_file, stream, cacheDir = task
+    for _ in fileRows(json_file, stream, cacheDir, Quarantine(os.devnull)):
+        pass
+    return json_file
+
+"""
+Parses json files into the columnar cache in cacheDir on a pool of jobs worker
+processes, so they can then be read back in order without decoding any json
+"""
+def cacheParallel(files, jobs, stream, cacheDir):
+    pool = Pool(jobs)
+    try:
+        for _ in pool.imap_unordered(cacheShard, [(f, stream, cacheDir) for f in files]):
+            pass
+    finally:
+        pool.terminate()
+        pool.join()
+
+"""
+Parses json files into the sink of an output format other than dat. With more
+than one job the files are first decoded in parallel into the columnar cache,
+a scratch one unless cacheDir is given, and then fed to the sink in order.
+"""
+def parseToSink(files, format, out=None, stream=False, jobs=1, cacheDir=None, quarantine=None):
+    scratch = None
+    if jobs > 1 and cacheDir is None:
+        scratch = cacheDir = tempfile.mkdtemp(prefix='cache-')
+    try:
+        if jobs > 1:
+            cacheParallel(files, jobs, stream, cacheDir)
+        sink = openSink(format, out)
+        seen = newSeenKeys()
+        for f in files:
+            parseJson(f, stream=stream, seen=seen, cacheDir=cacheDir, sink=sink,
+                    quarantine=quarantine)
+            print "Success parsing " + f
+        sink.close()
+    finally:
+        if scratch is not None:
+            shutil.rmtree(scratch)
 
 """
 Loops through each json files provided on the command line and passes each file
@@ -163,13 +808,48 @@ to the parser
 """
 def main(argv):
     if len(argv) < 2:
-        print >> sys.stderr, 'Usage: python skeleton_json_parser.py <path to json files>'
+        print >> sys.stderr, 'Usage: python skeleton_json_parser.py [--stream] [--jobs N] [--cache DIR] [--format dat|sqlite|columnar] [--out PATH] [--schema FILE] [--quarantine FILE] <path to json files>'
         sys.exit(1)
-    # loops over all .json files in the argument
-    for f in argv[1:]:
-        if isJson(f):
-            parseJson(f)
+    parser = argparse.ArgumentParser(prog=argv[0])
+    parser.add_argument('--stream', action='store_true',
+            help='decode items incrementally instead of loading whole files')
+    parser.add_argument('--jobs', type=int, default=1,
+            help='number of worker processes to parse files with (default 1)')
+    parser.add_argument('--cache', metavar='DIR',
+            help='read parsed rows from, and save them to, a columnar cache in DIR')
+    parser.add_argument('--format', choices=sorted(SINKS), default='dat',
+            help='output format: pipe separated .dat files (default), an SQLite '
+                 'database or a columnar directory')
+    parser.add_argument('--out', metavar='PATH',
+            help='where to write the output (default: the current directory for dat, '
+                 'AuctionBase for sqlite, columns for columnar)')
+    parser.add_argument('--schema', metavar='FILE',
+            help='items schema to decode with (default: the %s next to each json '
+                 'file, or else the one in ebay_data)' % SCHEMA_FILE)
+    parser.add_argument('--quarantine', metavar='FILE', default=QUARANTINE_FILE,
+            help='file malformed items are appended to (default %s)' % QUARANTINE_FILE)
+    parser.add_argument('files', nargs='+')
+    args = parser.parse_args(argv[1:])
+    files = [f for f in args.files if isJson(f)]
+    global schemaFile
+    schemaFile = args.schema
+    quarantine = Quarantine(args.quarantine)
+    outdir = '.' if args.out is None else args.out
+    if args.format != 'dat':
+        parseToSink(files, args.format, args.out, args.stream, args.jobs, args.cache, quarantine)
+    elif args.jobs > 1:
+        parseParallel(files, args.jobs, stream=args.stream, outdir=outdir, cacheDir=args.cache,
+                quarantine=quarantine)
+    else:
+        seen = newSeenKeys()
+        # loops over all .json files in the argument
+        for f in files:
+            parseJson(f, stream=args.stream, outdir=outdir, seen=seen, cacheDir=args.cache,
+                    quarantine=quarantine)
             print "Success parsing " + f
+    quarantine.close()
+    if quarantine.count:
+        print >> sys.stderr, 'Quarantined %d malformed items in %s' % (quarantine.count, quarantine.path)
 
 if __name__ == '__main__':
     main(sys.argv)
\ No newline at end of file
@@ -0,0 +1,68 @@
+-- description: Status of every auction, kept in Items and maintained by
+-- triggers, so that searches by status are index lookups
+
+PRAGMA foreign_keys = ON;
+
+-- An auction is notStarted before Started and close after Ends or once its
+-- Buy_Price is reached; open otherwise. Times are 'YYYY-MM-DD HH:MM:SS' text,
+-- which compares in chronological order.
+alter table Items add column Status TEXT;
+
+update Items set Status = (select case
+		when t.Time < Items.Started then 'notStarted'
+		when t.Time > Items.Ends or (Items.Buy_Price is not null and Items.Buy_Price != 0
+			and Items.Buy_Price <= Items.Currently) then 'close'
+		else 'open' end
+	from CurrentTime t);
+
+create index ItemsStatus on Items(Status);
+
+-- a new item, or an item whose price or times changed. The update only runs
+-- when the stored status is wrong, so a bid that leaves the auction open
+-- costs no second update of Items.
+create trigger ItemsStatusInsert
+	after insert on Items
+	begin
+		update Items set Status = (select case
+				when t.Time < Items.Started then 'notStarted'
+				when t.Time > Items.Ends or (Items.Buy_Price is not null and Items.Buy_Price != 0
+					and Items.Buy_Price <= Items.Currently) then 'close'
+				else 'open' end
+			from CurrentTime t)
+		where ItemID = NEW.ItemID;
+	end;
+
+create trigger ItemsStatusUpdate
+	after update of Currently, Buy_Price, Started, Ends on Items
+	when NEW.Status is not (select case
+			when t.Time < NEW.Started then 'notStarted'
+			when t.Time > NEW.Ends or (NEW.Buy_Price is not null and NEW.Buy_Price != 0
+				and NEW.Buy_Price <= NEW.Currently) then 'close'
+			else 'open' end
+		from CurrentTime t)
+	begin
+		update Items set Status = (select case
+				when t.Time < Items.Started then 'notStarted'
+				when t.Time > Items.Ends or (Items.Buy_Price is not null and Items.Buy_Price != 0
+					and Items.Buy_Price <= Items.Currently) then 'close'
+				else 'open' end
+			from CurrentTime t)
+		where ItemID = NEW.ItemID;
+	end;
+
+-- moving the time only changes the status of the auctions that start or end
+-- between the old and the new time, which the Started and Ends indexes find
+create trigger ItemsStatusTime
+	after update of Time on CurrentTime
+	begin
+		update Items set Status = (select case
+				when t.Time < Items.Started then 'notStarted'
+				when t.Time > Items.Ends or (Items.Buy_Price is not null and Items.Buy_Price != 0
+					and Items.Buy_Price <= Items.Currently) then 'close'
+				else 'open' end
+			from CurrentTime t)
+		where Started between min(OLD.Time, NEW.Time) and max(OLD.Time, NEW.Time)
+			or Ends between min(OLD.Time, NEW.Time) and max(OLD.Time, NEW.Time);
+	end;
+
+analyze Items;
@@ -0,0 +1,7 @@
+PRAGMA foreign_keys = ON;
+
+drop trigger ItemsStatusInsert;
+drop trigger ItemsStatusUpdate;
+drop trigger ItemsStatusTime;
+drop index ItemsStatus;
+alter table Items drop column Status;
@@ -0,0 +1,228 @@
+"""
+FILE: test_bulk_loader.py
+------------------
+Loads a json file of the corpus through bulk_loader.py --create and through
+the sqlite sink of skeleton_parser.py, and checks that the databases they
+build enforce what createDatabase.sh installs: bids update their item, bad
+bids and moving the time back are turned down, and descriptions are indexed
+for search.
+
+    python -m unittest test_bulk_loader
+"""
+
+import os
+import json
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import subprocess
+from distutils.spawn import find_executable
+
+import bulk_loader
+import skeleton_parser
+
+# A file with auctions still open at the time create.sql starts the database at
+ITEMS_FILE = os.path.join(bulk_loader.HERE, '..', 'ebay_data', 'items-38.json')
+
+"""
+Checks of a database loaded from ITEMS_FILE, built by load
+"""
+class LoadedDatabaseTest(object):
+    def setUp(self):
+        self.scratch = tempfile.mkdtemp(prefix='bulk-loader-')
+        self.db = os.path.join(self.scratch, 'AuctionBase')
+        self.load(self.db)
+        self.conn = sqlite3.connect(self.db, isolation_level=None)
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.scratch)
+
+    """
+    Returns an open auction with no Buy_Price, a user other than its seller and
+    the current time
+    """
+    def openAuction(self):
+        item, currently, bids, seller = self.conn.execute("SELECT ItemID, Currently, "
+                "Number_of_Bids, Seller_UserID FROM Items WHERE Status = 'open' "
+                "AND Buy_Price IS NULL ORDER BY ItemID LIMIT 1").fetchone()
+        user, = self.conn.execute('SELECT UserID FROM Users WHERE UserID != ? LIMIT 1',
+                (seller,)).fetchone()
+        now, = self.conn.execute('SELECT Time FROM CurrentTime').fetchone()
+        return item, currently, bids, user, now
+
+    def placeBid(self, item, user, amount, now):
+        self.conn.execute('INSERT INTO Bids (ItemID, UserID, Amount, Time) VALUES (?, ?, ?, ?)',
+                (item, user, amount, now))
+
+    def test_bid_updates_item(self):
+        item, currently, bids, user, now = self.openAuction()
+        self.placeBid(item, user, currently + 1, now)
+        self.assertEqual(self.conn.execute('SELECT Currently, Number_of_Bids FROM Items '
+                'WHERE ItemID = ?', (item,)).fetchone(), (currently + 1, bids + 1))
+
+    def test_bid_updates_item_once(self):
+        item, currently, bids, user, now = self.openAuction()
+        changes = self.conn.total_changes
+        self.placeBid(item, user, currently + 1, now)
+        # the row of Bids and a single update of Items, the auction staying open
+        self.assertEqual(self.conn.total_changes - changes, 2)
+
+    def test_bid_reaching_buy_price_closes_auction(self):
+        item, buyPrice, seller = self.conn.execute("SELECT ItemID, Buy_Price, Seller_UserID "
+                "FROM Items WHERE Status = 'open' AND Buy_Price > Currently "
+                "ORDER BY ItemID LIMIT 1").fetchone()
+        user, = self.conn.execute('SELECT UserID FROM Users WHERE UserID != ? LIMIT 1',
+                (seller,)).fetchone()
+        now, = self.conn.execute('SELECT Time FROM CurrentTime').fetchone()
+        self.placeBid(item, user, buyPrice, now)
+        self.assertEqual(self.conn.execute('SELECT Currently, Status FROM Items '
+                'WHERE ItemID = ?', (item,)).fetchone(), (buyPrice, 'close'))
+
+    def test_bid_not_above_current_price_rejected(self):
+        item, currently, bids, user, now = self.openAuction()
+        with self.assertRaises(sqlite3.DatabaseError):
+            self.placeBid(item, user, currently, now)
+        self.assertEqual(self.conn.execute('SELECT count(*) FROM Bids WHERE ItemID = ? '
+                'AND Time = ?', (item, now)).fetchone(), (0,))
+
+    def test_time_cannot_move_back(self):
+        with self.assertRaises(sqlite3.DatabaseError):
+            self.conn.execute("UPDATE CurrentTime SET Time = '2001-01-01 00:00:00'")
+
+    def test_descriptions_searchable(self):
+        self.assertTrue(self.conn.execute("SELECT rowid FROM ItemsSearch "
+                "WHERE ItemsSearch MATCH 'shipping' LIMIT 1").fetchone())
+
+class CreateTest(LoadedDatabaseTest, unittest.TestCase):
+    def load(self, db):
+        with open(os.devnull, 'w') as devnull:
+            stdout, bulk_loader.sys.stdout = bulk_loader.sys.stdout, devnull
+            try:
+                bulk_loader.main(['bulk_loader.py', '--db', db, '--create',
+                        '--quarantine', os.devnull, ITEMS_FILE])
+            finally:
+                bulk_loader.sys.stdout = stdout
+
+class SqliteSinkTest(LoadedDatabaseTest, unittest.TestCase):
+    def load(self, db):
+        sink = bulk_loader.openSqliteSink(db)
+        skeleton_parser.parseJson(ITEMS_FILE, sink=sink,
+                quarantine=skeleton_parser.Quarantine(os.devnull))
+        sink.close()
+
+"""
+Checks of bulk_loader.py --incremental on a database created from a copy of
+ITEMS_FILE
+"""
+class IncrementalTest(unittest.TestCase):
+    def setUp(self):
+        self.scratch = tempfile.mkdtemp(prefix='bulk-loader-')
+        self.db = os.path.join(self.scratch, 'AuctionBase')
+        self.json_file = os.path.join(self.scratch, 'items-x.json')
+        shutil.copy(ITEMS_FILE, self.json_file)
+        with open(os.devnull, 'w') as devnull:
+            stdout, bulk_loader.sys.stdout = bulk_loader.sys.stdout, devnull
+            try:
+                bulk_loader.main(['bulk_loader.py', '--db', self.db, '--create',
+                        '--quarantine', os.devnull, self.json_file])
+            finally:
+                bulk_loader.sys.stdout = stdout
+        self.conn = sqlite3.connect(self.db, isolation_level=None)
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.scratch)
+
+    def loadIncremental(self, files):
+        self.conn.execute('BEGIN IMMEDIATE')
+        result = bulk_loader.loadIncremental(self.conn, files)
+        self.conn.execute('COMMIT')
+        return result
+
+    def bidTriggers(self):
+        return sorted(name for name, in self.conn.execute("SELECT name FROM sqlite_master "
+                "WHERE type = 'trigger' AND tbl_name = 'Bids'"))
+
+    def test_rerun_skips_unchanged_file(self):
+        triggers = self.bidTriggers()
+        counts, skipped = self.loadIncremental([self.json_file])
+        self.assertEqual(skipped, [os.path.abspath(self.json_file)])
+        self.assertEqual(sum(counts.values()), 0)
+        self.assertEqual(self.bidTriggers(), triggers)
+
+    def test_changed_file_updates_items_in_place(self):
+        with open(self.json_file, 'r') as f:
+            items = json.load(f)
+        item = items['Items'][0]
+        item['Name'] = 'Renamed ' + item['Name']
+        with open(self.json_file, 'w') as f:
+            json.dump(items, f)
+        before, = self.conn.execute('SELECT count(*) FROM Items').fetchone()
+        triggers = self.bidTriggers()
+        counts, skipped = self.loadIncremental([self.json_file])
+        self.assertEqual(skipped, [])
+        self.assertEqual(self.conn.execute('SELECT Name FROM Items WHERE ItemID = ?',
+                (item['ItemID'],)).fetchone(), (item['Name'],))
+        self.assertEqual(self.conn.execute('SELECT count(*) FROM Items').fetchone(), (before,))
+        self.assertEqual(self.bidTriggers(), triggers)
+        # the file is recorded with its new digest, so loading it again skips it
+        self.assertEqual(self.loadIncremental([self.json_file])[1], [os.path.abspath(self.json_file)])
+
+    def test_new_file_adds_its_rows(self):
+        other = os.path.join(self.scratch, 'items-y.json')
+        shutil.copy(os.path.join(os.path.dirname(ITEMS_FILE), 'items-39.json'), other)
+        before, = self.conn.execute('SELECT count(*) FROM Items').fetchone()
+        counts, skipped = self.loadIncremental([self.json_file, other])
+        self.assertEqual(skipped, [os.path.abspath(self.json_file)])
+        after, = self.conn.execute('SELECT count(*) FROM Items').fetchone()
+        self.assertEqual(after - before, counts['items'])
+        self.assertTrue(counts['items'])
+
+"""
+Checks that a database built by load.txt from the .dat files of the parser
+holds the same items and users as one built by bulk_loader.py, texts that look
+like the NULL marker \\N of the .dat files included
+"""
+@unittest.skipUnless(find_executable('sqlite3'), 'needs the sqlite3 shell')
+class LoadTxtTest(unittest.TestCase):
+    def setUp(self):
+        self.scratch = tempfile.mkdtemp(prefix='bulk-loader-')
+
+    def tearDown(self):
+        shutil.rmtree(self.scratch)
+
+    def test_null_marker_text_agrees_with_bulk_loader(self):
+        with open(ITEMS_FILE, 'r') as f:
+            items = json.load(f)['Items'][:5]
+        for item, text in zip(items, ['\\N', '\\\\N', 'N', None, '\\N\\N']):
+            item['Description'] = text
+            item['Location'] = text
+        items[0]['Country'] = '\\N'
+        path = os.path.join(self.scratch, 'items-x.json')
+        with open(path, 'w') as f:
+            json.dump({'Items': items}, f)
+        skeleton_parser.parseJson(path, outdir=self.scratch)
+        shell = os.path.join(self.scratch, 'AuctionBase')
+        for script in ['create.sql', 'load.txt']:
+            with open(os.path.join(bulk_loader.HERE, script), 'r') as f:
+                subprocess.check_call(['sqlite3', shell], stdin=f, cwd=self.scratch)
+        loaded = os.path.join(self.scratch, 'BulkLoaded')
+        conn = sqlite3.connect(loaded, isolation_level=None)
+        bulk_loader.runScript(conn, bulk_loader.CREATE_SQL)
+        bulk_loader.loadJson(conn, [path])
+        conn.close()
+        queries = ['SELECT ItemID, Description FROM Items ORDER BY ItemID',
+                   'SELECT UserID, Location, Country FROM Users ORDER BY UserID']
+        results = []
+        for db in [shell, loaded]:
+            conn = sqlite3.connect(db)
+            results.append([conn.execute(query).fetchall() for query in queries])
+            conn.close()
+        self.assertEqual(results[0], results[1])
+        descriptions = [description for _, description in results[0][0]]
+        self.assertEqual(sorted(descriptions), sorted(['\\N', '\\\\N', 'N', None, '\\N\\N']))
+
+if __name__ == '__main__':
+    unittest.main()
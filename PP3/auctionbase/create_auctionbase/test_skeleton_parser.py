@@ -0,0 +1,285 @@
+"""
+FILE: test_skeleton_parser.py
+------------------
+Tests of the decoding and transforms of skeleton_parser.py.
+
+    python -m unittest test_skeleton_parser
+"""
+
+import copy
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import columnar_cache
+import skeleton_parser
+
+ITEMS_FILE = os.path.join(os.path.dirname(skeleton_parser.DEFAULT_SCHEMA_FILE), 'items-0.json')
+
+class SchemaTest(unittest.TestCase):
+    def setUp(self):
+        self.scratch = tempfile.mkdtemp(prefix='skeleton-parser-')
+        self.json_file = os.path.join(self.scratch, 'items-x.json')
+        shutil.copy(ITEMS_FILE, self.json_file)
+
+    def tearDown(self):
+        skeleton_parser.schemaFile = None
+        shutil.rmtree(self.scratch)
+
+    def test_file_without_schema_uses_default_schema(self):
+        decoder = skeleton_parser.itemDecoder(self.json_file)
+        self.assertIs(decoder, skeleton_parser.itemDecoder(ITEMS_FILE))
+        rows = list(skeleton_parser.fileRows(self.json_file))
+        self.assertEqual(rows, list(skeleton_parser.fileRows(ITEMS_FILE)))
+
+    def test_missing_schema_given_raises(self):
+        skeleton_parser.schemaFile = os.path.join(self.scratch, 'missing.txt')
+        with self.assertRaises(IOError):
+            skeleton_parser.itemDecoder(self.json_file)
+
+class QuarantineTest(unittest.TestCase):
+    def setUp(self):
+        self.scratch = tempfile.mkdtemp(prefix='skeleton-parser-')
+
+    def tearDown(self):
+        shutil.rmtree(self.scratch)
+
+    """
+    Writes an items file holding the first item of ITEMS_FILE as it is and a
+    copy of it with ItemID id for each change, a function spoiling the copy
+    """
+    def writeItems(self, changes):
+        with open(ITEMS_FILE, 'r') as f:
+            good = json.load(f)['Items'][0]
+        items = [good]
+        for n, change in enumerate(changes):
+            item = copy.deepcopy(good)
+            item['ItemID'] = str(n + 1)
+            change(item)
+            items.append(item)
+        path = os.path.join(self.scratch, 'items-x.json')
+        with open(path, 'w') as f:
+            json.dump({'Items': items}, f)
+        return path, good
+
+    def test_malformed_items_quarantined(self):
+        changes = [
+            lambda item: item.update(Name=None),
+            lambda item: item.update(Currently=None),
+            lambda item: item['Seller'].update(UserID=None),
+            lambda item: item.pop('Ends'),
+            lambda item: item.update(First_Bid=12),
+            lambda item: item.update(Category=[None]),
+            lambda item: item.update(Description=['not', 'text']),
+        ]
+        path, good = self.writeItems(changes)
+        quarantine = skeleton_parser.Quarantine(os.path.join(self.scratch, 'quarantine.json'))
+        skeleton_parser.parseJson(path, outdir=self.scratch, quarantine=quarantine)
+        quarantine.close()
+        with open(quarantine.path, 'r') as f:
+            quarantined = [json.loads(line) for line in f]
+        self.assertEqual([entry['item']['ItemID'] for entry in quarantined],
+                [str(n + 1) for n in range(len(changes))])
+        self.assertEqual(quarantined[0]['error'], 'item.Name is null, not a string')
+        self.assertEqual(quarantined[3]['error'], 'missing field Ends')
+        self.assertEqual(quarantined[4]['error'], 'item.First_Bid is int, not a string')
+        with open(os.path.join(self.scratch, 'items.dat'), 'r') as f:
+            lines = f.readlines()
+        self.assertEqual([line.split('|', 1)[0] for line in lines], [good['ItemID']])
+        with open(os.path.join(self.scratch, 'users.dat'), 'r') as f:
+            self.assertNotIn('None', f.read())
+
+"""
+Parses files one at a time into a directory serial and with parseParallel on
+jobs workers into a directory parallel, and returns the contents of the .dat
+files of each
+"""
+def serialAndParallel(scratch, files, jobs):
+    outputs = []
+    for name in ['serial', 'parallel']:
+        outdir = os.path.join(scratch, name)
+        os.mkdir(outdir)
+        with open(os.devnull, 'w') as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                if name == 'serial':
+                    seen = skeleton_parser.newSeenKeys()
+                    for f in files:
+                        skeleton_parser.parseJson(f, outdir=outdir, seen=seen)
+                else:
+                    skeleton_parser.parseParallel(files, jobs, outdir=outdir)
+            finally:
+                sys.stdout = stdout
+        contents = {}
+        for dat in skeleton_parser.DAT_FILES:
+            with open(os.path.join(outdir, dat), 'r') as f:
+                contents[dat] = f.read()
+        outputs.append(contents)
+    return outputs
+
+class ParallelTest(unittest.TestCase):
+    def setUp(self):
+        self.scratch = tempfile.mkdtemp(prefix='skeleton-parser-')
+
+    def tearDown(self):
+        shutil.rmtree(self.scratch)
+
+    def test_multiline_text_matches_serial(self):
+        with open(ITEMS_FILE, 'r') as f:
+            items = json.load(f)['Items'][:4]
+        for item in items:
+            item['Description'] = 'Great item\nShipping: buyer pays\n'
+            item['Location'] = 'Two\nLines'
+        files = []
+        # every item shows up in two files, so the merge has to drop whole rows
+        for n in range(3):
+            path = os.path.join(self.scratch, 'items-%d.json' % n)
+            with open(path, 'w') as f:
+                json.dump({'Items': items[n:n + 2]}, f)
+            files.append(path)
+        serial, parallel = serialAndParallel(self.scratch, files, 3)
+        self.assertEqual(serial['items.dat'].count('\n'), 4 * 3)
+        self.assertEqual(parallel, serial)
+
+    def test_corpus_files_match_serial(self):
+        corpus = os.path.dirname(ITEMS_FILE)
+        files = [os.path.join(corpus, 'items-%d.json' % n) for n in range(6)]
+        serial, parallel = serialAndParallel(self.scratch, files, 4)
+        self.assertTrue(serial['bids.dat'])
+        self.assertEqual(parallel, serial)
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.scratch = tempfile.mkdtemp(prefix='skeleton-parser-')
+        self.cache = os.path.join(self.scratch, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.scratch)
+
+    def cacheEntries(self):
+        return [name for name in os.listdir(self.cache) if name != 'sources']
+
+    def test_warm_cache_matches_cold_parse(self):
+        cold = list(skeleton_parser.fileRows(ITEMS_FILE, cacheDir=self.cache))
+        self.assertEqual(cold, list(skeleton_parser.fileRows(ITEMS_FILE)))
+        self.assertEqual(len(self.cacheEntries()), 1)
+        # a warm read never gets to decode the json
+        readItems = skeleton_parser.readItems
+        skeleton_parser.readItems = None
+        try:
+            warm = list(skeleton_parser.fileRows(ITEMS_FILE, cacheDir=self.cache))
+        finally:
+            skeleton_parser.readItems = readItems
+        # cached rows come back relation by relation rather than item by item
+        self.assertEqual(sorted(warm), sorted(cold))
+
+    def test_changed_file_misses_cache(self):
+        path = os.path.join(self.scratch, 'items-x.json')
+        shutil.copy(ITEMS_FILE, path)
+        list(skeleton_parser.fileRows(path, cacheDir=self.cache))
+        with open(path, 'r') as f:
+            items = json.load(f)
+        del items['Items'][0]
+        with open(path, 'w') as f:
+            json.dump(items, f)
+        rows = list(skeleton_parser.fileRows(path, cacheDir=self.cache))
+        self.assertEqual(sorted(rows), sorted(skeleton_parser.fileRows(path)))
+        self.assertEqual(len(self.cacheEntries()), 2)
+
+    def test_dirty_values_left_uncached(self):
+        with open(ITEMS_FILE, 'r') as f:
+            items = json.load(f)['Items'][:3]
+        items[1]['Currently'] = '$'
+        path = os.path.join(self.scratch, 'items-x.json')
+        with open(path, 'w') as f:
+            json.dump({'Items': items}, f)
+        rows = list(skeleton_parser.fileRows(path, cacheDir=self.cache))
+        self.assertEqual(rows, list(skeleton_parser.fileRows(path)))
+        self.assertEqual(self.cacheEntries(), [])
+
+class ColumnarSinkTest(unittest.TestCase):
+    def setUp(self):
+        self.scratch = tempfile.mkdtemp(prefix='skeleton-parser-')
+
+    def tearDown(self):
+        shutil.rmtree(self.scratch)
+
+    def parse(self, out):
+        sink = skeleton_parser.openSink('columnar', out)
+        skeleton_parser.parseJson(ITEMS_FILE, sink=sink,
+                quarantine=skeleton_parser.Quarantine(os.devnull))
+        sink.close()
+
+    def test_existing_directory_refused(self):
+        notes = os.path.join(self.scratch, 'notes.txt')
+        with open(notes, 'w') as f:
+            f.write('kept')
+        with self.assertRaises(IOError):
+            self.parse(self.scratch)
+        self.assertEqual(os.listdir(self.scratch), ['notes.txt'])
+
+    def test_earlier_output_replaced(self):
+        out = os.path.join(self.scratch, 'columns')
+        self.parse(out)
+        first = sorted(columnar_cache.readRows(out, skeleton_parser.RELATIONS))
+        self.parse(out)
+        self.assertEqual(sorted(columnar_cache.readRows(out, skeleton_parser.RELATIONS)), first)
+        self.assertEqual(os.listdir(self.scratch), ['columns'])
+
+class StreamItemsTest(unittest.TestCase):
+    def setUp(self):
+        self.scratch = tempfile.mkdtemp(prefix='skeleton-parser-')
+        with open(ITEMS_FILE, 'r') as f:
+            self.items = json.load(f)['Items']
+
+    def tearDown(self):
+        shutil.rmtree(self.scratch)
+
+    def writeItems(self, texts):
+        path = os.path.join(self.scratch, 'items-x.json')
+        with open(path, 'w') as f:
+            f.write('{"Items": [' + ', '.join(texts) + ']}')
+        return path
+
+    def test_small_chunks_match_whole_file(self):
+        path = self.writeItems([json.dumps(item) for item in self.items])
+        with open(path, 'r') as f:
+            self.assertEqual(list(skeleton_parser.streamItems(f, 64)), self.items)
+
+    def test_malformed_item_reported_where_it_is(self):
+        texts = [json.dumps(item) for item in self.items]
+        texts[3] = texts[3].replace('"Currently": ', '"Currently": x', 1)
+        path = self.writeItems(texts)
+        with open(path, 'r') as f:
+            text = f.read()
+            offset = text.index('"Currently": x') + len('"Currently": ')
+            f.seek(0)
+            with self.assertRaises(ValueError) as raised:
+                list(skeleton_parser.streamItems(f, 64))
+            # the rest of the file is not read in looking for the end of the item
+            self.assertLess(f.tell(), offset + 1024)
+        self.assertEqual(str(raised.exception), 'Expecting object at char %d of %s' % (offset, path))
+
+class TransformDttmTest(unittest.TestCase):
+    def setUp(self):
+        skeleton_parser.dateMemo.clear()
+
+    def test_well_formed(self):
+        self.assertEqual(skeleton_parser.transformDttm('Dec-03-01 18:10:40'), '2001-12-03 18:10:40')
+
+    def test_malformed_after_warm_memo(self):
+        cold = skeleton_parser.transformDttm('Dec-03-01 18:10:40 ')
+        skeleton_parser.transformDttm('Dec-03-01 18:10:40')
+        self.assertIn('Dec-03-01 ', skeleton_parser.dateMemo)
+        for dttm in ['Dec-03-01 18:10:40 ', 'Dec-03-01  18:10:40', ' Dec-03-01 18:10:40']:
+            warm = skeleton_parser.transformDttm(dttm)
+            skeleton_parser.dateMemo.clear()
+            self.assertEqual(warm, skeleton_parser.transformDttm(dttm))
+            skeleton_parser.transformDttm('Dec-03-01 18:10:40')
+        self.assertEqual(cold, '2001-12-03 18:10:40')
+
+if __name__ == '__main__':
+    unittest.main()
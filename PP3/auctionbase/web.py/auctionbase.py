@@ -55,7 +55,8 @@ urls = ('/currtime', 'curr_time',
         '/', 'homepage',
         '/search', 'search',
         '/viewMore/(.*)', 'viewMore',
-        '/add_bid', 'add_bid'
+        '/add_bid', 'add_bid',
+        '/searchstats', 'search_stats'
         # TODO: add additional URLs here
         # first parameter => URL, second parameter => class name
         )
@@ -80,9 +81,9 @@ class add_bid:
         itemID = post_params['itemID']
         userID = post_params['userID']
         price = post_params['price']
-        result, msg = sqlitedb.addBid(itemID, userID, price)
+        result, reason = sqlitedb.addBid(itemID, userID, price)
         if result == -1:
-            return render_template('add_bid.html', add_result=False, message=msg)
+            return render_template('add_bid.html', add_result=False, message=sqlitedb.BID_MESSAGES[reason])
         else:
             return render_template('add_bid.html', add_result=True)
 
@@ -94,27 +95,47 @@ class search:
     def GET(self):
         return render_template('search.html')
 
+    # The next page of a search is posted with the same inputs, plus the
+    # cursor the previous page was rendered with
     def POST(self):
-        post_params = web.input()
+        post_params = web.input(cursor=None, pageSize=sqlitedb.PAGE_SIZE)
         itemID = post_params['itemID']
         minPrice = post_params['minPrice']
         maxPrice = post_params['maxPrice']
         itemDesp = post_params['itemDesp']
         category = post_params['category']
         status = post_params['status']
+        cursor = post_params['cursor']
+        try:
+            pageSize = int(post_params['pageSize'])
+        except ValueError:
+            pageSize = sqlitedb.PAGE_SIZE
+        next_cursor = None
         if itemID or minPrice or maxPrice or itemDesp or category:
-            result, msg = sqlitedb.searchAuctions(itemID, minPrice, maxPrice, itemDesp, category, status)
+            result, msg, next_cursor = sqlitedb.searchAuctions(itemID, minPrice, maxPrice, itemDesp,
+                    category, status, pageSize, cursor)
             message = 'Search performed. '+msg
         else:
             result = []
             message = 'No inputs given'
             print("Nothinginput");
-        return render_template('search.html', search_result=result, message=message)
+        search = {'itemID': itemID, 'minPrice': minPrice, 'maxPrice': maxPrice,
+                'itemDesp': itemDesp, 'category': category, 'status': status, 'pageSize': pageSize}
+        return render_template('search.html', search_result=result, message=message,
+                search=search, next_cursor=next_cursor)
+
+class search_stats:
+    # Hit and miss counters of the search cache, one 'name value' line each,
+    # for monitoring
+    def GET(self):
+        web.header('Content-Type', 'text/plain', unique=True)
+        stats = sqlitedb.searchCacheStats()
+        return ''.join('%s %s\n' % (name, stats[name]) for name in sorted(stats))
 
 class viewMore:
     def GET(self, keys):
-        result = sqlitedb.getDetails(keys)
-        return render_template('view_more.html', search_result=result)
+        item = sqlitedb.getDetails(keys)
+        return render_template('view_more.html', item=item)
 
 class curr_time:
     # A simple GET request, to '/currtime'
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+# Bid ingestion benchmark for AuctionBase. Copies the database and has
+# --threads bidders place --bids bids between them, once with sqlitedb.addBid,
+# a transaction per bid, and once through sqlitedb.queueBid, which group
+# commits them. Every bid is on an auction of its own that is open at the
+# current time, at one more than its current price, so every bid should be
+# accepted. Bids/s, latency percentiles and the results are printed for each,
+# and the benchmark fails if either leaves an item whose Number_of_Bids or
+# Currently disagrees with its bids, or if any queued bid is turned down.
+#
+#     python bid_benchmark.py [--db AuctionBase] [--threads N] [--bids N]
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, 'lib'))
+
+import web
+import sqlitedb
+
+# Ways of placing a bid to compare, by name
+MODES = [
+    ('addBid', lambda *bid: sqlitedb.addBid(*bid)),
+    ('queueBid', lambda *bid: sqlitedb.queueBid(*bid)),
+]
+
+# returns one bid on each of up to count auctions open in the database, from
+# a user other than its seller
+def openBids(db, count):
+    users = [row.UserID for row in db.query('select UserID from Users order by UserID limit 2')]
+    bids = []
+    for item in db.query("select i.ItemID, i.Currently, i.Seller_UserID from Items i, CurrentTime t "
+            "where t.Time >= i.Started and t.Time <= i.Ends "
+            "and not (i.Buy_Price is not null and i.Buy_Price != 0 and i.Buy_Price <= i.Currently + 1) "
+            "and not exists (select * from Bids b where b.ItemID = i.ItemID and b.Time = t.Time) "
+            "order by i.ItemID limit $count", vars={'count': count}):
+        user = users[0] if users[0] != item.Seller_UserID else users[1]
+        bids.append((item.ItemID, user, item.Currently + 1))
+    return bids
+
+# places bids with place from threads threads, returning the seconds it took,
+# the latency of every bid and the results by reason
+def run(place, bids, threads):
+    pending = list(reversed(bids))
+    lock = threading.Lock()
+    latencies, results = [], {}
+    def bidder():
+        sqlitedb.enforceForeignKey()
+        while True:
+            with lock:
+                if not pending:
+                    return
+                bid = pending.pop()
+            start = time.time()
+            result, reason = place(*bid)
+            latency = time.time() - start
+            with lock:
+                latencies.append(latency)
+                results[reason or 'accepted'] = results.get(reason or 'accepted', 0) + 1
+    workers = [threading.Thread(target=bidder) for _ in range(threads)]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.time() - start, sorted(latencies), results
+
+# returns the number of items whose bid count or current price disagrees
+# with their bids
+def inconsistentItems(db):
+    return db.query('select count(*) as n from Items i where Number_of_Bids != '
+            '(select count(*) from Bids b where b.ItemID = i.ItemID) or Currently < '
+            '(select max(Amount) from Bids b where b.ItemID = i.ItemID)')[0].n
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog=argv[0])
+    parser.add_argument('--db', default='AuctionBase',
+            help='database to copy and bid on (default AuctionBase)')
+    parser.add_argument('--threads', type=int, default=64,
+            help='bidders placing bids at the same time (default 64)')
+    parser.add_argument('--bids', type=int, default=1000,
+            help='bids to place, at most one per open auction (default 1000)')
+    args = parser.parse_args(argv[1:])
+    web.config.debug = False
+    scratch = tempfile.mkdtemp(prefix='bids-')
+    try:
+        failed = False
+        print '%-10s %6s %9s %9s %10s %10s  %s' % ('mode', 'bids', 'seconds', 'bids/s',
+                'p50 ms', 'p99 ms', 'results')
+        for name, place in MODES:
+            path = os.path.join(scratch, name)
+            shutil.copy(args.db, path)
+            sqlitedb.db = sqlitedb.connect(path)
+            sqlitedb.bidQueue = sqlitedb.BidQueue()
+            bids = openBids(sqlitedb.db, args.bids)
+            stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+            try:
+                seconds, latencies, results = run(place, bids, args.threads)
+            finally:
+                sys.stdout = stdout
+            print '%-10s %6d %9.3f %9.0f %10.1f %10.1f  %s' % (name, len(bids), seconds,
+                    len(bids) / seconds, percentile(latencies, 0.5) * 1000,
+                    percentile(latencies, 0.99) * 1000,
+                    ', '.join('%s %d' % item for item in sorted(results.items())))
+            if sqlitedb.bidQueue.batches:
+                print '%-10s %d batches of %.1f bids on average' % ('', sqlitedb.bidQueue.batches,
+                        float(sqlitedb.bidQueue.bids) / sqlitedb.bidQueue.batches)
+            inconsistent = inconsistentItems(sqlitedb.connect(path))
+            if inconsistent:
+                print >> sys.stderr, '%s left %d inconsistent items' % (name, inconsistent)
+                failed = True
+            if name == 'queueBid' and results.get('accepted') != len(bids):
+                print >> sys.stderr, 'queueBid turned down bids'
+                failed = True
+    finally:
+        shutil.rmtree(scratch)
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main(sys.argv)
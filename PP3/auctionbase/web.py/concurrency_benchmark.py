@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+# Readers-plus-writer benchmark for AuctionBase. Copies the database and, for
+# --seconds, has --readers threads request the details page of items and
+# search open auctions by category while --writers bidders post bids to
+# /add_bid, the way browsers do during a bid spike. Requests go through
+# app.request, so every one runs the loadhooks and the cleanup of a real
+# request. It runs once with the connections SQLite opens by default, a
+# rollback journal synced at every commit, and once with
+# sqlitedb.CONNECTION_PRAGMAS. Reads/s and bids/s, with their latency
+# percentiles, are printed for each, and the benchmark fails if either leaves
+# an item whose Number_of_Bids or Currently disagrees with its bids.
+#
+#     python concurrency_benchmark.py [--db AuctionBase] [--readers N] [--writers N]
+#                                     [--seconds N]
+#
+# Each search asks for a different minimum price, so that reads reach the
+# database rather than the search cache. With the rollback journal a reader
+# has to wait while a bid is committed, and the bids wait for readers to let
+# go of the file; in WAL mode neither waits for the other.
+#
+# On the corpus with the defaults, the tuned setup places three to four times
+# as many bids (70 to 105 bids/s against 20 to 27) and turns none down as
+# busy. Reads do not speed up: every request runs in this one Python process,
+# so the extra bids take their share of it and reads/s stay level or drop
+# (30 to 55 reads/s under either setup).
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, 'lib'))
+
+import web
+import sqlitedb
+import auctionbase
+from bid_benchmark import openBids, inconsistentItems, percentile
+
+# Connection setups to compare, by name. The journal mode is kept in the
+# database file, so the default one is set back explicitly.
+PROFILES = [
+    ('default', [('journal_mode', 'DELETE'), ('foreign_keys', 'ON')]),
+    ('tuned', sqlitedb.CONNECTION_PRAGMAS),
+]
+
+# Categories the readers search open auctions in, in turn
+CATEGORIES = ['Books', 'Collectibles', 'Clothing & Accessories', 'Music', 'Toys & Hobbies']
+
+# keeps the latencies and outcomes of one kind of operation across threads
+class Tally(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.results = {}
+
+    def add(self, latency, result):
+        with self.lock:
+            self.latencies.append(latency)
+            self.results[result] = self.results.get(result, 0) + 1
+
+    def row(self, name, seconds):
+        latencies = sorted(self.latencies) or [0]
+        return '%-8s %-7s %7d %9.0f %10.1f %10.1f  %s' % ('', name, len(self.latencies),
+                len(self.latencies) / seconds, percentile(latencies, 0.5) * 1000,
+                percentile(latencies, 0.99) * 1000,
+                ', '.join('%s %d' % item for item in sorted(self.results.items())))
+
+# returns the web app, with the processors auctionbase.py runs it with
+def application():
+    app = web.application(auctionbase.urls, vars(auctionbase))
+    app.add_processor(web.loadhook(sqlitedb.enforceForeignKey))
+    return app
+
+# returns how the add_bid page answered a bid: accepted, or the reason code of
+# the message it shows
+def bidResult(page):
+    if 'alert-success' in page:
+        return 'accepted'
+    for reason, message in sqlitedb.BID_MESSAGES.items():
+        if message in page:
+            return reason
+    return 'failed'
+
+# requests the pages of items, one after the other, and searches until stop
+# is set
+def reader(app, items, offset, stop, reads):
+    n = offset
+    while not stop.is_set():
+        start = time.time()
+        if n % 2:
+            response = app.request('/search', method='POST', data={'itemID': '',
+                    'minPrice': str(n % 1000), 'maxPrice': '', 'itemDesp': '',
+                    'category': CATEGORIES[n % len(CATEGORIES)], 'status': 'open'})
+        else:
+            response = app.request('/viewMore/%s' % items[n % len(items)])
+        reads.add(time.time() - start, 'ok' if response.status == '200 OK' else response.status)
+        n += 1
+
+# posts the bids of pending to /add_bid until there are none left or stop is
+# set
+def writer(app, pending, lock, stop, writes):
+    while not stop.is_set():
+        with lock:
+            if not pending:
+                return
+            itemID, userID, price = pending.pop()
+        start = time.time()
+        response = app.request('/add_bid', method='POST',
+                data={'itemID': itemID, 'userID': userID, 'price': price})
+        writes.add(time.time() - start, bidResult(response.data)
+                if response.status == '200 OK' else response.status)
+
+# runs readers and writers against the app for seconds, returning the seconds
+# they ran for and the tallies of reads and bids
+def run(app, bids, readers, writers, seconds):
+    items = [bid[0] for bid in bids]
+    pending = list(reversed(bids))
+    lock, stop = threading.Lock(), threading.Event()
+    reads, writes = Tally(), Tally()
+    threads = [threading.Thread(target=reader, args=(app, items, n, stop, reads))
+            for n in range(readers)]
+    threads += [threading.Thread(target=writer, args=(app, pending, lock, stop, writes))
+            for _ in range(writers)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return time.time() - start, reads, writes
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog=argv[0])
+    parser.add_argument('--db', default='AuctionBase',
+            help='database to copy and run against (default AuctionBase)')
+    parser.add_argument('--readers', type=int, default=8,
+            help='threads reading at the same time (default 8)')
+    parser.add_argument('--writers', type=int, default=32,
+            help='bidders placing bids at the same time (default 32)')
+    parser.add_argument('--seconds', type=float, default=5,
+            help='how long each setup runs for (default 5)')
+    args = parser.parse_args(argv[1:])
+    web.config.debug = False
+    app = application()
+    scratch = tempfile.mkdtemp(prefix='concurrency-')
+    try:
+        failed = False
+        print '%-8s %-7s %7s %9s %10s %10s  %s' % ('setup', 'op', 'count', 'per s',
+                'p50 ms', 'p99 ms', 'results')
+        for name, pragmas in PROFILES:
+            path = os.path.join(scratch, name)
+            shutil.copy(args.db, path)
+            sqlitedb.db = sqlitedb.connect(path, pragmas)
+            # the first connection switches the journal mode before any
+            # other is open
+            sqlitedb.getTime()
+            bids = openBids(sqlitedb.db, sys.maxint)
+            # failed requests print their tracebacks, which are counted instead
+            stdout, stderr = sys.stdout, sys.stderr
+            sys.stdout = sys.stderr = open(os.devnull, 'w')
+            try:
+                seconds, reads, writes = run(app, bids, args.readers, args.writers,
+                        args.seconds)
+            finally:
+                sys.stdout, sys.stderr = stdout, stderr
+            print name
+            print reads.row('read', seconds)
+            print writes.row('bid', seconds)
+            inconsistent = inconsistentItems(sqlitedb.connect(path, pragmas))
+            if inconsistent:
+                print >> sys.stderr, '%s left %d inconsistent items' % (name, inconsistent)
+                failed = True
+    finally:
+        shutil.rmtree(scratch)
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main(sys.argv)
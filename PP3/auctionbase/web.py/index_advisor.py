@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+# Index advisor for AuctionBase. Replays the queries of the web app, the
+# statements inside the triggers and constraints_verify.sql through EXPLAIN
+# QUERY PLAN and reports every one that scans a whole table, along with the
+# foreign keys whose child columns no index starts with. Exits with status 1
+# when it finds either.
+#
+#     python index_advisor.py [--db AuctionBase] [--constraints FILE]
+#
+# The app queries are recorded while sqlitedb runs them for real against the
+# database, so they are exactly what the app sends. Only read-only functions
+# are replayed; what a new bid or a time change does to the database shows up
+# through the triggers.
+
+import os
+import re
+import sys
+import argparse
+from itertools import combinations
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, 'lib'))
+
+import web
+import sqlitedb
+
+DEFAULT_CONSTRAINTS = os.path.join(HERE, '..', 'create_auctionbase', 'constraints_verify.sql')
+
+# Values the search form is replayed with
+SEARCH_SAMPLE = [('itemID', '1043374545'), ('minPrice', '10'), ('maxPrice', '50'),
+        ('itemDesp', 'guitar'), ('category', 'Books')]
+STATUSES = ['all', 'open', 'close', 'notStarted']
+
+# Tables known to hold a single row, which are fine to scan
+SINGLE_ROW_TABLES = ['CurrentTime']
+
+# Tables the app may look at without an index to use
+CATALOG_TABLES = ['sqlite_master']
+
+# wraps a web.py database, recording every query run through it with the
+# label of the app function running it
+class Recorder(object):
+    def __init__(self, db):
+        self.db = db
+        self.label = None
+        self.queries = []
+
+    def query(self, sql_query, vars=None, **keywords):
+        self.queries.append((self.label, sql_query, vars or {}))
+        return self.db.query(sql_query, vars=vars, **keywords)
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+# runs the read-only functions of sqlitedb, every combination of search
+# filters included, and returns the queries they ran as (label, query, vars)
+def appQueries(db):
+    recorder = Recorder(db)
+    sqlitedb.db = recorder
+    itemID = SEARCH_SAMPLE[0][1]
+    for label, call in [('getTime', lambda: sqlitedb.getTime()),
+                        ('getItemById', lambda: sqlitedb.getItemById(itemID)),
+                        ('getDetails', lambda: sqlitedb.getDetails(itemID))]:
+        recorder.label = label
+        call()
+    for n in range(1, len(SEARCH_SAMPLE) + 1):
+        for filters in combinations(SEARCH_SAMPLE, n):
+            for status in STATUSES:
+                search = dict((name, '') for name, _ in SEARCH_SAMPLE)
+                search.update(filters)
+                recorder.label = 'searchAuctions %s status=%s' % (
+                        '+'.join(name for name, _ in filters), status)
+                sqlitedb.searchAuctions(status=status, **search)
+    sqlitedb.db = db
+    return recorder.queries
+
+# returns the statements run by the triggers of the database as (label,
+# query, vars), WHEN clauses included, with NEW and OLD values replaced by 0
+# and raise() by NULL so that they can be explained on their own
+def triggerQueries(db):
+    queries = []
+    for trigger in db.query("select name, sql from sqlite_master where type = 'trigger'"):
+        sql = re.sub(r'\b(NEW|OLD)\.\w+', '0', trigger.sql, flags=re.I)
+        sql = re.sub(r'\braise\s*\([^)]*\)', 'NULL', sql, flags=re.I)
+        when = re.search(r'\bwhen\b(.*?)\bbegin\b', sql, re.I | re.S)
+        if when:
+            queries.append(('trigger ' + trigger.name, 'select ' + when.group(1).strip(), {}))
+        body = re.search(r'\bbegin\b(.*)\bend\b', sql, re.I | re.S)
+        for statement in body.group(1).split(';'):
+            if statement.strip():
+                queries.append(('trigger ' + trigger.name, statement.strip(), {}))
+    return queries
+
+# returns the statements of an SQL file as (label, query, vars)
+def fileQueries(path):
+    with open(path, 'r') as f:
+        text = '\n'.join(line for line in f.read().splitlines()
+                if not line.strip().startswith('--'))
+    return [(os.path.basename(path), statement.strip(), {})
+            for statement in text.split(';') if statement.strip()]
+
+# returns the full scans in the plan of a query, leaving out those of tables
+# with a single row and of virtual tables, which use their own index. When
+# nested is set, only scans inside subqueries count: a constraint check has to
+# read every row of the table it checks anyway.
+def fullScans(db, sql_query, vars, nested=False):
+    allowed = set(SINGLE_ROW_TABLES + CATALOG_TABLES)
+    for table in SINGLE_ROW_TABLES:
+        allowed.update(re.findall(r'\b%s\s+(?:as\s+)?(\w+)' % table, sql_query, re.I))
+    plan = db.query('EXPLAIN QUERY PLAN ' + sql_query, vars=vars)
+    if isinstance(plan, (int, long)):
+        # statements like insert ... values have an empty plan
+        return []
+    plan = list(plan)
+    # the rows of a subquery in the from clause are read as they are made, or
+    # from where they were materialized, by a scan of its alias
+    for step in plan:
+        derived = re.match(r'(?:CO-ROUTINE|MATERIALIZE) (\w+)', step.detail)
+        if derived:
+            allowed.add(derived.group(1))
+    scans = []
+    for step in plan:
+        scan = re.match(r'SCAN (?:TABLE )?(?!CONSTANT ROW)(\w+)', step.detail)
+        if nested and not step.parent:
+            continue
+        if scan and scan.group(1) not in allowed and 'VIRTUAL TABLE' not in step.detail:
+            scans.append(step.detail)
+    return scans
+
+# returns the foreign keys of the database whose child columns are not the
+# leading columns of any index, as strings
+def unindexedForeignKeys(db):
+    found = []
+    for table in db.query("select name from sqlite_master where type = 'table'"):
+        keys = {}
+        for key in db.query('select * from pragma_foreign_key_list($table)', vars={'table': table.name}):
+            keys.setdefault(key.id, []).append(key)
+        indexes = []
+        for index in db.query('select name from pragma_index_list($table)', vars={'table': table.name}):
+            indexes.append([column.name for column in db.query(
+                    'select name from pragma_index_info($index)', vars={'index': index.name})])
+        for key in keys.values():
+            columns = [column['from'] for column in key]
+            if not any(sorted(index[:len(columns)]) == sorted(columns) for index in indexes):
+                found.append('%s(%s) -> %s(%s)' % (table.name, ', '.join(columns), key[0].table,
+                        ', '.join(str(column.to) for column in key)))
+    return found
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog=argv[0])
+    parser.add_argument('--db', default='AuctionBase',
+            help='SQLite database to advise on (default AuctionBase)')
+    parser.add_argument('--constraints', default=DEFAULT_CONSTRAINTS,
+            help='SQL file of constraint checks to explain too (default %s)'
+                 % os.path.relpath(DEFAULT_CONSTRAINTS))
+    args = parser.parse_args(argv[1:])
+    if not os.path.isfile(args.db):
+        print >> sys.stderr, 'No database at ' + args.db
+        sys.exit(1)
+    web.config.debug = False
+    db = web.database(dbn='sqlite', db=args.db)
+
+    queries = appQueries(db) + triggerQueries(db)
+    checks = []
+    if os.path.isfile(args.constraints):
+        checks = fileQueries(args.constraints)
+    checked, scanning = set(), 0
+    for label, sql_query, vars in queries + checks:
+        if sql_query in checked:
+            continue
+        checked.add(sql_query)
+        scans = fullScans(db, sql_query, vars, nested=(label, sql_query, vars) in checks)
+        if scans:
+            scanning += 1
+            print '%s: %s' % (label, '; '.join(scans))
+            print '    ' + ' '.join(sql_query.split())
+    foreignKeys = unindexedForeignKeys(db)
+    for key in foreignKeys:
+        print 'unindexed foreign key: ' + key
+    print '%d queries checked, %d with full scans, %d unindexed foreign keys' % (
+            len(checked), scanning, len(foreignKeys))
+    if scanning or foreignKeys:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -1,8 +1,70 @@
+import re
 import web
-import datetime
+import json
+import math
+import time
+import base64
+import Queue
+import sqlite3
+import threading
+from collections import OrderedDict
 
-db = web.database(dbn='sqlite',
-        db='AuctionBase' #TODO: add your SQLite database filename
+# Pragmas every connection to the database is set up with, once, as it is
+# opened. In WAL mode readers keep reading while a bid is written instead of
+# waiting for its commit, and a commit only has to reach the log: with
+# synchronous = NORMAL the log is synced at checkpoints rather than at every
+# commit, which can lose the last bids on a power failure but never corrupts
+# the database. The page cache (in KiB when negative), memory mapped reads and
+# in-memory temporary tables for the sorts of searches cut the reads that go
+# to the file.
+CONNECTION_PRAGMAS = [
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -16384),
+    ('mmap_size', 268435456),
+    ('temp_store', 'MEMORY'),
+    ('foreign_keys', 'ON'),
+]
+
+# returns a sqlite3 connection class running pragmas, given as (name, value)
+# pairs, on each connection it opens. The journal mode is kept in the database
+# file and switching it needs the file to itself, so it is only set when it
+# differs, typically by the first connection ever opened.
+def connectionFactory(pragmas):
+    class Connection(sqlite3.Connection):
+        def __init__(self, *args, **keywords):
+            sqlite3.Connection.__init__(self, *args, **keywords)
+            for name, value in pragmas:
+                if name == 'journal_mode' and \
+                        self.execute('PRAGMA journal_mode').fetchone()[0].lower() == value.lower():
+                    continue
+                self.execute('PRAGMA %s = %s' % (name, value))
+    return Connection
+
+# web.py's SQLite database, keeping the connection each thread opens for good.
+# web.py forgets the connections of a thread at the end of every request, so
+# they would otherwise be opened and set up again, with an empty page cache,
+# for each request.
+class PersistentSqliteDB(web.db.SqliteDB):
+    def __init__(self, **keywords):
+        self.connections = threading.local()
+        web.db.SqliteDB.__init__(self, **keywords)
+
+    def _connect(self, keywords):
+        conn = getattr(self.connections, 'conn', None)
+        if conn is None:
+            conn = self.connections.conn = web.db.SqliteDB._connect(self, keywords)
+        else:
+            # a request that failed halfway may have left its transaction open
+            conn.rollback()
+        return conn
+
+# opens the SQLite database at path through web.py, with a connection per
+# thread, each set up with pragmas once
+def connect(path, pragmas=CONNECTION_PRAGMAS):
+    return PersistentSqliteDB(db=path, factory=connectionFactory(pragmas))
+
+db = connect('AuctionBase' #TODO: add your SQLite database filename
     )
 
 ######################BEGIN HELPER METHODS######################
@@ -10,7 +72,10 @@ db = web.database(dbn='sqlite',
 # Enforce foreign key constraints
 # WARNING: DO NOT REMOVE THIS!
 def enforceForeignKey():
-    db.query('PRAGMA foreign_keys = ON')
+    # foreign keys are turned on with the rest of CONNECTION_PRAGMAS as each
+    # connection is opened, not per request. This runs at the start of every
+    # request, so a time changed outside the app is picked up by the next one
+    clearTimeCache()
 
 # initiates a transaction on the database
 def transaction():
@@ -29,11 +94,29 @@ def transaction():
 #
 # check out http://webpy.org/cookbook/transactions for examples
 
+# CurrentTime only changes through changeTime, so its value is kept once read.
+# timeVersion is bumped whenever the kept value is dropped, so that a value
+# read before a change is never kept after it.
+currentTime = None
+timeVersion = 0
+
+# drops the kept current time, so that the next getTime reads it again
+def clearTimeCache():
+    global currentTime, timeVersion
+    timeVersion += 1
+    currentTime = None
+
 # returns the current time from your database
 def getTime():
+    global currentTime
+    if currentTime is not None:
+        return currentTime
+    version = timeVersion
     query_string = 'select Time from CurrentTime'
     results = query(query_string)
     # alternatively: return results[0]['time']
+    if version == timeVersion:
+        currentTime = results[0].Time
     return results[0].Time
 
 # modify the current time in your database
@@ -45,6 +128,9 @@ def changeTime(newTime):
     except Exception as e:
         print("catch exception ", e.message)
         return -1, "Failed to update time"
+    finally:
+        clearTimeCache()
+        dataChanged()
     return 0, None
 # returns a single item specified by the Item's ID in the database
 # Note: if the `result' list is empty (i.e. there are no items for a
@@ -57,29 +143,383 @@ def getItemById(item_id):
     return result[0]
 
 
+# Reasons addBid can turn a bid down for, and what to tell the bidder
+BID_MESSAGES = {
+    'badPrice': 'Can not add bid: the price must be a positive number.',
+    'noItem': 'Can not add bid: there is no such item.',
+    'noUser': 'Can not add bid: there is no such user.',
+    'ownItem': 'Can not add bid: sellers can not bid on their own items.',
+    'notStarted': 'Can not add bid: the auction has not started yet.',
+    'closed': 'Can not add bid: the auction is closed.',
+    'tooLow': 'Can not add bid: the price must be higher than the current price.',
+    'timeTaken': 'Can not add bid: the item already has a bid at the current time.',
+    'busy': 'Can not add bid: the database is busy, please try again.',
+    'failed': 'Can not add bid.',
+}
+
+# Everything a bid is checked against, read in one go
+BID_CHECK_QUERY = ('select t.Time, i.ItemID, i.Currently, i.Buy_Price, i.Started, i.Ends, i.Seller_UserID, '
+    'exists (select * from Users where UserID = $userID) as UserExists, '
+    'exists (select * from Bids b where b.ItemID = i.ItemID and b.Time = t.Time) as TimeTaken '
+    'from CurrentTime t left join Items i on i.itemID = $itemID')
+
+# returns the reason a bid of price by userID on the auction in check, a row of
+# BID_CHECK_QUERY, is turned down for, or None if it can be placed
+def bidProblem(check, userID, price):
+    if check.ItemID is None:
+        return 'noItem'
+    if not check.UserExists:
+        return 'noUser'
+    if userID == check.Seller_UserID:
+        return 'ownItem'
+    if check.Time < check.Started:
+        return 'notStarted'
+    if check.Time > check.Ends or (check.Buy_Price and check.Buy_Price <= check.Currently):
+        return 'closed'
+    if price <= check.Currently:
+        return 'tooLow'
+    if check.TimeTaken:
+        # Bids has one bid per item and time
+        return 'timeTaken'
+    return None
+
+# returns price as a number, or None if it is not a positive finite one. An
+# infinite price would be accepted by the triggers and could never be outbid.
+def bidPrice(price):
+    try:
+        price = float(price)
+    except (TypeError, ValueError):
+        return None
+    if math.isinf(price) or math.isnan(price) or not price > 0:
+        return None
+    return price
+
+# checks a bid and inserts it at the current time if it passes, inside the
+# transaction the caller has open. Returns None when the bid is placed and
+# the reason it is turned down for otherwise.
+def placeBid(itemID, userID, price):
+    check = query(BID_CHECK_QUERY, {'itemID': itemID, 'userID': userID})[0]
+    problem = bidProblem(check, userID, price)
+    if problem is None:
+        db.query('insert into Bids (ItemID, UserID, Amount, Time) values ($itemID, $userID, $price, $time)',
+                {'itemID': check.ItemID, 'userID': userID, 'price': price, 'time': check.Time})
+    return problem
+
+# places a bid at the current time. The checks and the insert run in one
+# transaction that takes the write lock up front, so no other bid or time
+# change can come in between. Returns 0, None when the bid is placed and -1
+# and one of the reasons of BID_MESSAGES otherwise.
 def addBid(itemID, userID, price):
-    query_string = 'select Buy_Price, Currently from Items where itemID = $itemID'
-    current_price = query(query_string, {'itemID': itemID});
-    if current_price:
-        print(current_price)
-        if current_price[0]['Buy_Price'] and current_price[0]['Buy_Price'] <= current_price[0]['Currently']:
-            return -1, "Can not add bid."
-    currTime = getTime()
-    query_string = 'insert into Bids values ($itemID, $userID, $price, $currTime)'
+    price = bidPrice(price)
+    if price is None:
+        return -1, 'badPrice'
+    outer = bool(db.ctx.get('transactions'))
+    t = transaction()
     try:
-        result = db.query(query_string, {'itemID': itemID, 'userID': userID, 'price': price, 'currTime': currTime})
+        if not outer:
+            db.query('BEGIN IMMEDIATE')
+        problem = placeBid(itemID, userID, price)
     except Exception as e:
-        print("catch error ", e.message)
-        return -1, "Can not add bid."
-
-    print(result, "type ", type(result))
+        t.rollback()
+        print("catch error ", e)
+        if 'locked' in str(e) or 'busy' in str(e):
+            return -1, 'busy'
+        return -1, 'failed'
+    if problem is not None:
+        t.rollback()
+        return -1, problem
+    t.commit()
+    dataChanged()
     return 0, None
 
+# Bids queued with queueBid are placed by a single writer thread in batches,
+# one transaction and so one sync to disk per batch. A batch closes after
+# BID_BATCH_SIZE bids or BID_BATCH_WAIT seconds after its first bid, whichever
+# comes first. Bids of a batch are checked one after the other inside its
+# transaction, each seeing the ones before it, so the rules are the same as
+# for addBid.
+#
+# The queue is for callers that place many bids at once, not for the add_bid
+# page. In WAL mode a commit no longer waits for a sync to disk, which took
+# away most of what batching saved: with bid_benchmark.py, 8 bidders place
+# about 2100 bids/s with addBid and 660 through the queue, which only pulls
+# ahead at 64 bidders, about 1750 against 900 bids/s.
+BID_BATCH_SIZE = 200
+BID_BATCH_WAIT = 0.005
+# how long a bidder waits for its queued bid to be taken up by the writer
+# before withdrawing it. A bid the writer has taken up is always waited for,
+# so that a bidder told the database is busy can be sure the bid is not placed.
+BID_QUEUE_TIMEOUT = 10
+
+# the queue of bids and the thread placing them
+class BidQueue(object):
+    def __init__(self, batchSize=BID_BATCH_SIZE, wait=BID_BATCH_WAIT):
+        self.batchSize = batchSize
+        self.wait = wait
+        self.pending = Queue.Queue()
+        self.thread = None
+        # held to start the thread, and to decide between the writer taking up
+        # a bid and its bidder withdrawing it
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.bids = 0
+        self.fallbacks = 0
+
+    # queues a bid and waits for it to be committed or turned down, returning
+    # what addBid would
+    def submit(self, itemID, userID, price):
+        price = bidPrice(price)
+        if price is None:
+            return -1, 'badPrice'
+        self.start()
+        bid = web.storage(args=(itemID, userID, price), done=threading.Event(), result=None,
+                taken=False, withdrawn=False)
+        self.pending.put(bid)
+        if not bid.done.wait(BID_QUEUE_TIMEOUT):
+            with self.lock:
+                if not bid.taken:
+                    bid.withdrawn = True
+                    return -1, 'busy'
+            bid.done.wait()
+        return bid.result
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='BidQueue')
+                self.thread.daemon = True
+                self.thread.start()
+
+    def run(self):
+        enforceForeignKey()
+        while True:
+            batch = [self.pending.get()]
+            closes = time.time() + self.wait
+            while len(batch) < self.batchSize:
+                remaining = closes - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=remaining))
+                except Queue.Empty:
+                    break
+            with self.lock:
+                batch = [bid for bid in batch if not bid.withdrawn]
+                for bid in batch:
+                    bid.taken = True
+            try:
+                self.place(batch)
+            except Exception as e:
+                # every bidder gets an answer and the writer carries on, with
+                # the connection reset the way the end of a request resets it
+                print("catch error ", e)
+                db._ctx.clear()
+                for bid in batch:
+                    if bid.result is None:
+                        bid.result = (-1, 'failed')
+            finally:
+                for bid in batch:
+                    bid.done.set()
+
+    def place(self, batch):
+        if not batch:
+            return
+        t = transaction()
+        try:
+            db.query('BEGIN IMMEDIATE')
+            problems = [placeBid(*bid.args) for bid in batch]
+            t.commit()
+        except Exception as e:
+            # a trigger's raise(rollback) or a failed commit undoes the whole
+            # batch, so every bid of it is placed again on its own
+            print("catch error ", e)
+            t.rollback()
+            db.ctx.rollback()
+            self.fallbacks += 1
+            for bid in batch:
+                bid.result = addBid(*bid.args)
+            return
+        self.batches += 1
+        self.bids += len(batch)
+        for bid, problem in zip(batch, problems):
+            bid.result = (0, None) if problem is None else (-1, problem)
+        if None in problems:
+            dataChanged()
+
+bidQueue = BidQueue()
+
+# places a bid through the bid queue, for many bids coming in at once.
+# Returns what addBid does once the batch of the bid is committed.
+def queueBid(itemID, userID, price):
+    return bidQueue.submit(itemID, userID, price)
+
+
+# An auction is over early once its Buy_Price is reached. Never NULL, so that
+# it can be negated.
+BOUGHT = '(i.Buy_Price IS NOT NULL AND i.Buy_Price != 0 AND i.Buy_Price <= i.Currently)'
+
+# The status of an auction, as SQL conditions against the current time t.Time,
+# for databases without the Status column of status_add.sql. Times are stored
+# as 'YYYY-MM-DD HH:MM:SS', which compare as text in chronological order.
+STATUS_CONDITIONS = {
+    'open': '(t.Time >= i.Started and t.Time <= i.Ends and not ' + BOUGHT + ')',
+    'close': '(t.Time > i.Ends or (t.Time >= i.Started and ' + BOUGHT + '))',
+    'notStarted': 't.Time < i.Started',
+}
+
+# Full-text index of Items.Description, created by fts_add.sql. Whether the
+# database has it is looked up on the first description search.
+FULL_TEXT_TABLE = 'ItemsSearch'
+fullText = None
 
-def searchAuctions(itemID, minPrice, maxPrice, itemDesp, category, status):
+# returns whether the database has the full-text index of descriptions
+def hasFullText():
+    global fullText
+    if fullText is None:
+        query_string = "select name from sqlite_master where type = 'table' and name = $name"
+        fullText = len(query(query_string, {'name': FULL_TEXT_TABLE})) > 0
+    return fullText
 
-    conditions = ["i.itemID = c.itemID"]
+# Status of every item, created by status_add.sql and kept current by its
+# triggers. Whether the database has it is looked up on the first status search
+# or details page.
+STATUS_COLUMN = 'Status'
+statusColumn = None
+
+# returns whether Items has the Status column
+def hasStatusColumn():
+    global statusColumn
+    if statusColumn is None:
+        query_string = "select name from pragma_table_info('Items') where name = $name"
+        statusColumn = len(query(query_string, {'name': STATUS_COLUMN})) > 0
+    return statusColumn
+
+# turns search text into an FTS5 query matching every word of it as a prefix,
+# e.g. 'red guit' into '"red"* "guit"*', or returns None if it has no words
+def matchQuery(text):
+    words = re.findall(r'\w+', text, re.UNICODE)
+    if not words:
+        return None
+    return ' '.join('"%s"*' % word for word in words)
+
+# Search results come a page at a time. A page is picked by the sort key of
+# the last auction of the page before it, so that every page costs the same
+# however far into the results it is.
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# turns the sort key of the last auction shown, and the number of auctions
+# shown so far, into the cursor of the next page
+def encodeCursor(key, shown):
+    return base64.urlsafe_b64encode(json.dumps({'key': key, 'shown': shown}))
+
+# returns the sort key and the number of auctions shown of a cursor made by
+# encodeCursor, raising ValueError if it is not one
+def decodeCursor(cursor):
+    try:
+        page = json.loads(base64.urlsafe_b64decode(str(cursor)))
+        return list(page['key']), int(page['shown'])
+    except (TypeError, ValueError, KeyError):
+        raise ValueError('invalid page cursor')
+
+# Recent search results are kept, the least recently used dropped first, for
+# at most SEARCH_CACHE_TTL seconds. Every result is stored with the version of
+# the data it was read at, and addBid and changeTime bump the version, so a
+# result never outlives a change made through the app. The time to live bounds
+# how long changes made by other programs go unseen.
+SEARCH_CACHE_SIZE = 256
+SEARCH_CACHE_TTL = 60
+
+# a bounded LRU cache of values that expire after ttl seconds or once the
+# version they were put at is no longer current, counting hits and misses
+class SearchCache(object):
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                expires, version, value = entry
+                if version == self.version and time.time() < expires:
+                    self.entries[key] = entry
+                    self.hits += 1
+                    return value
+            self.misses += 1
+            return None
+
+    # stores value unless the data changed since version was read
+    def put(self, key, version, value):
+        with self.lock:
+            if version != self.version:
+                return
+            self.entries.pop(key, None)
+            self.entries[key] = (time.time() + self.ttl, version, value)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def bump(self):
+        with self.lock:
+            self.version += 1
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries),
+                    'maxSize': self.size, 'ttl': self.ttl, 'version': self.version}
+
+searchCache = SearchCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+
+# to be called whenever the app changes the data searches read
+def dataChanged():
+    searchCache.bump()
+
+# returns the hit and miss counters, size and data version of the search cache
+def searchCacheStats():
+    return searchCache.stats()
+
+# turns a filter value into the form the query treats it as, so that e.g.
+# prices '10' and '10.00' share a cache entry
+def normalizeFilter(value, kind):
+    value = value.strip() if value else ''
+    try:
+        return kind(value) if value else ''
+    except ValueError:
+        return value
+
+# returns a page of at most pageSize auctions matching the search, the message
+# to show with it and the cursor of the next page, None on the last one.
+# Results come from the search cache when the same search was run lately.
+def searchAuctions(itemID, minPrice, maxPrice, itemDesp, category, status,
+        pageSize=PAGE_SIZE, cursor=None):
+    key = (normalizeFilter(itemID, int), normalizeFilter(minPrice, float),
+            normalizeFilter(maxPrice, float), itemDesp or '', category or '', status,
+            pageSize, cursor or None)
+    found = searchCache.get(key)
+    if found is not None:
+        results, message, nextCursor = found
+        return list(results), message, nextCursor
+    version = searchCache.version
+    found = findAuctions(itemID, minPrice, maxPrice, itemDesp, category, status, pageSize, cursor)
+    searchCache.put(key, version, found)
+    results, message, nextCursor = found
+    return list(results), message, nextCursor
+
+# runs a search for searchAuctions
+def findAuctions(itemID, minPrice, maxPrice, itemDesp, category, status,
+        pageSize=PAGE_SIZE, cursor=None):
+
+    conditions = []
     conddict = {}
+    tables = 'Items i'
+    what = 'i.itemID, i.Started, i.Ends'
+    key = ['i.itemID']
     if itemID:
         conditions.append('i.itemID = $itemID')
         conddict['itemID'] = itemID
@@ -90,57 +530,111 @@ def searchAuctions(itemID, minPrice, maxPrice, itemDesp, category, status):
         conditions.append('i.Currently <= $maxPrice')
         conddict['maxPrice'] = maxPrice
     if category:
-        conditions.append('c.category = $category')
+        # Categories is only looked at for a category search, and then as a
+        # semi-join: the items having the category, each once, rather than a
+        # row per category of every item
+        conditions.append('i.itemID in (select c.itemID from Categories c where c.category = $category)')
         conddict['category'] = category
     if itemDesp:
-        conditions.append('i.description like $itemDesp')
-        conddict['itemDesp'] = "%" + itemDesp + "%"
-    query_string = 'select DISTINCT i.itemID, i.Started, i.Ends from Items i, Categories c where ' + ' and '.join(conditions)
-    candidates = query(query_string, conddict)
-    results = []
-    if status == 'all':
-        return candidates, "{} auction(s) found".format(len(candidates))
-    else:
-        for candidate in candidates:
-            if getStatus(candidate) == status:
-                results.append(candidate)
-    return results, "{} auction(s) found".format(len(results))
-
-def getDetails(keys):
-    itemID = keys
-    query_string1 = 'select * from Items where itemID = $itemID'
-    query_string2 = 'select * from Bids where itemID = $itemID order by Amount DESC'
-    query_string3 = 'select Category from Categories where itemID = $itemID'
-    result = query(query_string1, {'itemID': itemID}) + query(query_string2, {'itemID': itemID}) + \
-             [{'Category': ', '.join([c['Category'].encode("ASCII") for c in query(query_string3, {'itemID': itemID})])}]
-    status = getStatus(result[0])
-    result += [{'Status ': status}]
-    if status == 'close':
-        if 'Amount' in result[1]:
-            result += [{'Winner ': result[1]['UserID']}]
+        terms = matchQuery(itemDesp)
+        if terms and hasFullText():
+            # the rowid of the index is the ItemID; best matches come first
+            tables += ', ItemsSearch s'
+            conditions.append('s.rowid = i.itemID and ItemsSearch match $itemDesp')
+            conddict['itemDesp'] = terms
+            what += ', s.rank as Rank'
+            key = ['s.rank', 'i.itemID']
         else:
-            result += [{'Winner ': 'None'}]
-    return result
-
-
-def getStatus(instance):
-    currTime = getTime()
-    currTime = datetime.datetime.strptime(currTime, "%Y-%m-%d %H:%M:%S")
-    startTime = datetime.datetime.strptime(instance.Started, "%Y-%m-%d %H:%M:%S")
-    endTime = datetime.datetime.strptime(instance.Ends, "%Y-%m-%d %H:%M:%S")
-    if currTime > endTime:
-        return 'close'
-    elif currTime >= startTime and currTime <= endTime:
-        query_string = 'select Buy_Price, Currently from Items where itemID = $itemID'
-        current_price = query(query_string, {'itemID': instance.ItemID})
-        if current_price[0]['Buy_Price'] and current_price[0]['Buy_Price'] <= current_price[0]['Currently']:
-            return 'close'
+            conditions.append('i.description like $itemDesp')
+            conddict['itemDesp'] = "%" + itemDesp + "%"
+    if (minPrice or maxPrice) and len(key) == 1 and not itemID:
+        # price searches come cheapest first, so that pages are read off the
+        # index on Currently, whose entries are in (Currently, ItemID) order,
+        # starting at the lowest price asked for
+        what += ', i.Currently as Price'
+        key = ['i.Currently', 'i.itemID']
+    if status != 'all':
+        if status not in STATUS_CONDITIONS:
+            return [], "0 auction(s) found", None
+        if hasStatusColumn():
+            conditions.append('i.Status = $status')
+            conddict['status'] = status
         else:
-            return 'open'
-    return 'notStarted'
-
+            # the status is checked in the same query, against the single row
+            # of CurrentTime
+            tables += ', CurrentTime t'
+            conditions.append(STATUS_CONDITIONS[status])
+    shown = 0
+    if cursor:
+        try:
+            after, shown = decodeCursor(cursor)
+        except ValueError:
+            return [], "Invalid page, please search again", None
+        if len(after) != len(key):
+            return [], "Invalid page, please search again", None
+        # auctions sorting after the last one shown
+        names = ['after%d' % n for n in range(len(key))]
+        conditions.append('(%s) > (%s)' % (', '.join(key), ', '.join('$' + name for name in names)))
+        conddict.update(zip(names, after))
+    pageSize = max(1, min(int(pageSize), MAX_PAGE_SIZE))
+    # every table joined matches at most one row per item, so no DISTINCT is
+    # needed
+    query_string = 'select ' + what + ' from ' + tables
+    if conditions:
+        query_string += ' where ' + ' and '.join(conditions)
+    # one auction more than the page holds tells whether there is a next page
+    query_string += ' order by ' + ', '.join(key) + ' limit $limit'
+    conddict['limit'] = pageSize + 1
+    results = query(query_string, conddict)
+    nextCursor = None
+    if len(results) > pageSize:
+        results = results[:pageSize]
+        last = results[-1]
+        nextCursor = encodeCursor([last.get('Rank', last.get('Price')), last.ItemID]
+                if len(key) == 2 else [last.ItemID], shown + pageSize)
+    for result in results:
+        result.pop('Rank', None)
+        result.pop('Price', None)
+    if not shown and not nextCursor:
+        return results, "{} auction(s) found".format(len(results)), None
+    if not results:
+        return results, "No more auction(s) found", None
+    message = "Auction(s) {} to {} shown".format(shown + 1, shown + len(results))
+    if nextCursor:
+        message += ", more on the next page"
+    return results, message, nextCursor
 
+# The item, its categories, its bids from the highest down and its status,
+# all in one query. Categories and bids come back as JSON arrays. The status
+# is worked out from the current time when Items has no Status column.
+DETAILS_COLUMNS = ("select i.*, "
+    "(select json_group_array(c.Category) from Categories c where c.itemID = i.itemID) as Categories, "
+    "(select json_group_array(json_object('UserID', b.UserID, 'Amount', b.Amount, 'Time', b.Time)) "
+    "from (select * from Bids where itemID = i.itemID order by Amount desc) b) as Bids")
+DETAILS_QUERY = DETAILS_COLUMNS + " from Items i where i.itemID = $itemID"
+DETAILS_STATUS_QUERY = (DETAILS_COLUMNS + ", "
+    "case when " + STATUS_CONDITIONS['open'] + " then 'open' "
+    "when " + STATUS_CONDITIONS['close'] + " then 'close' "
+    "else 'notStarted' end as Status "
+    "from Items i, CurrentTime t where i.itemID = $itemID")
 
+# returns the details of an item as one record: the columns of Items, the
+# list of its Categories, its Bids from the highest down, its Status and the
+# Winner of a closed auction (None when it had no bids), or None if there is
+# no such item
+def getDetails(keys):
+    itemID = keys
+    query_string = DETAILS_QUERY if hasStatusColumn() else DETAILS_STATUS_QUERY
+    result = query(query_string, {'itemID': itemID})
+    if len(result) == 0:
+        return None
+    item = result[0]
+    item.Categories = json.loads(item.Categories)
+    item.Bids = [web.storage(bid) for bid in json.loads(item.Bids)]
+    item.Winner = None
+    if item.Status == 'close' and item.Bids:
+        item.Winner = item.Bids[0].UserID
+    return item
 
 # wrapper method around web.py's db.query method
 # check out http://webpy.org/cookbook/query for more info
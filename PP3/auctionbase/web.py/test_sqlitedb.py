@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+# Tests of the searches of sqlitedb against a database loaded from a file of
+# the corpus by bulk_loader.py --create, indexes included.
+#
+#     python -m unittest test_sqlitedb
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, 'lib'))
+sys.path.insert(0, os.path.join(HERE, '..', 'create_auctionbase'))
+
+import web
+import sqlitedb
+import bulk_loader
+import index_advisor
+
+ITEMS_FILE = os.path.join(HERE, '..', 'ebay_data', 'items-38.json')
+
+class SearchTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        web.config.debug = False
+        cls.scratch = tempfile.mkdtemp(prefix='sqlitedb-')
+        cls.path = os.path.join(cls.scratch, 'AuctionBase')
+        stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        try:
+            bulk_loader.main(['bulk_loader.py', '--db', cls.path, '--create',
+                    '--quarantine', os.devnull, ITEMS_FILE])
+        finally:
+            sys.stdout = stdout
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.scratch)
+
+    def setUp(self):
+        self.db = sqlitedb.connect(self.path)
+        self.recorder = index_advisor.Recorder(self.db)
+        self.moduleDB, sqlitedb.db = sqlitedb.db, self.recorder
+
+    def tearDown(self):
+        sqlitedb.db = self.moduleDB
+
+    # runs a search, returning its results, next cursor and the plans of the
+    # queries it ran
+    def search(self, *args):
+        del self.recorder.queries[:]
+        results, message, cursor = sqlitedb.findAuctions(*args)
+        plans = [(sql_query, vars, [step.detail for step in
+                self.db.query('EXPLAIN QUERY PLAN ' + sql_query, vars=vars)])
+                for label, sql_query, vars in self.recorder.queries]
+        return results, cursor, plans
+
+    def assertUsesPriceIndex(self, plans):
+        search = [plan for sql_query, vars, plan in plans if 'from Items i' in sql_query]
+        self.assertEqual(len(search), 1)
+        self.assertTrue(any('ItemsCurrently' in step for step in search[0]), search[0])
+        for sql_query, vars, plan in plans:
+            self.assertEqual(index_advisor.fullScans(self.db, sql_query, vars), [])
+
+    def test_selective_price_search_uses_index(self):
+        top, = self.db.query('select max(Currently) as n from Items')
+        results, cursor, plans = self.search('', str(top.n), '', '', '', 'all')
+        self.assertEqual(len(results), 1)
+        self.assertUsesPriceIndex(plans)
+
+    def test_next_page_of_price_search_uses_index(self):
+        results, cursor, plans = self.search('', '', '100', '', '', 'all', 10)
+        self.assertTrue(cursor)
+        results, cursor, plans = self.search('', '', '100', '', '', 'all', 10, cursor)
+        self.assertUsesPriceIndex(plans)
+
+    def test_price_search_pages_cheapest_first(self):
+        expected = [row.ItemID for row in self.db.query(
+                'select ItemID from Items where Currently >= 10 order by Currently, ItemID')]
+        found, cursor = [], None
+        while True:
+            results, message, cursor = sqlitedb.findAuctions('', '10', '', '', '', 'all', 7, cursor)
+            found += [result.ItemID for result in results]
+            if not cursor:
+                break
+        self.assertEqual(found, expected)
+
+class BidPriceTest(unittest.TestCase):
+    def test_non_finite_prices_rejected(self):
+        for price in ['inf', 'infinity', '-inf', '1e309', 'nan']:
+            self.assertIsNone(sqlitedb.bidPrice(price), price)
+            self.assertEqual(sqlitedb.addBid('1', 'user', price), (-1, 'badPrice'))
+
+    def test_positive_prices_accepted(self):
+        self.assertEqual(sqlitedb.bidPrice('12.50'), 12.5)
+        self.assertIsNone(sqlitedb.bidPrice('0'))
+
+if __name__ == '__main__':
+    unittest.main()